@@ -0,0 +1,321 @@
+"""
+Vectorised takeoff calculations over many scenarios at once: grid sweeps over
+the Cartesian product of axis values and scenario files (takeoff-console.py
+--batch). Both are evaluated and encoded in fixed size chunks, so memory does
+not grow with the number of rows.
+"""
+
+import csv
+import io
+import itertools
+import json
+from dataclasses import dataclass
+from typing import Iterator, Sequence
+
+import numpy as np
+
+from performance import DerateTables, derates
+from tables import Interpolator, PerformanceTables, load_tables
+
+
+# rows evaluated and encoded at a time
+SWEEP_CHUNK_ROWS = 65536
+
+SWEEP_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def grid_mask(interp_func: Interpolator, *coords: np.ndarray) -> np.ndarray:
+    """Mask of the points that lie inside the interpolator's grid"""
+    mask = np.ones(len(coords[0]), dtype=bool)
+    for axis, values in zip(interp_func.grid, coords):
+        mask &= (values >= axis[0]) & (values <= axis[-1])
+    return mask
+
+
+def round_exact(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    `np.round` agreeing with Python's `round`. numpy scales by 10**ndigits
+    before rounding, which can push a near tie like 86.35 the other way.
+    """
+    rounded = np.round(values, ndigits)
+    scaled = values * 10**ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(value, ndigits) for value in values[near_tie].tolist()]
+    return rounded
+
+
+def find_n1_batch(assumed_temp: np.ndarray, press_altitude: np.ndarray, oat: np.ndarray, bleeds: np.ndarray,
+                  derate_tables: DerateTables) -> np.ndarray:
+    """
+    Vectorised equivalent of `performance.derate_n1` for a single derate.
+    Scenarios outside the tables come back as NaN.
+    """
+    n1 = np.full(len(assumed_temp), np.nan)
+    delta_temp = assumed_temp - oat
+    valid = grid_mask(derate_tables.n1, press_altitude, assumed_temp) \
+        & grid_mask(derate_tables.n1_reduction, delta_temp, oat)
+
+    n1[valid] = derate_tables.n1(np.column_stack((press_altitude[valid], assumed_temp[valid]))) \
+        - derate_tables.n1_reduction(np.column_stack((delta_temp[valid], oat[valid])))
+
+    return round_exact(n1, 1) + np.where(bleeds, 0, 1)
+
+
+def find_trim_batch(weight: np.ndarray, cg: np.ndarray, derate_tables: DerateTables) -> np.ndarray:
+    """
+    Vectorised equivalent of `performance.stab_trim_setting` for a single derate.
+    Scenarios outside the table come back as NaN.
+    """
+    trim = np.full(len(weight), np.nan)
+    valid = grid_mask(derate_tables.stab_trim, weight, cg)
+    trim[valid] = derate_tables.stab_trim(np.column_stack((weight[valid], cg[valid])))
+    return np.round(trim * 4) / 4
+
+
+@dataclass(frozen=True)
+class Sweep:
+    """
+    Cartesian product of named axes, the last axis varying fastest.
+    `derate` holds derate names, every other axis numbers (or booleans for `bleeds`).
+    """
+    table: str  # "n1" or "trim"
+    axes: dict[str, Sequence]
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(len(values) for values in self.axes.values())
+
+    def __len__(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    def chunks(self, tables: PerformanceTables, chunk_rows: int = SWEEP_CHUNK_ROWS) -> Iterator[dict[str, np.ndarray]]:
+        """{column: values} of consecutive row ranges, NaN where a point is outside the tables"""
+        axes = {name: np.asarray(values) for name, values in self.axes.items()}
+        for start in range(0, len(self), chunk_rows):
+            positions = np.unravel_index(np.arange(start, min(start + chunk_rows, len(self))), self.shape)
+            columns = {name: values[position] for (name, values), position in zip(axes.items(), positions)}
+            result = np.full(len(positions[0]), np.nan)
+            for derate in np.unique(columns['derate']):
+                rows = columns['derate'] == derate
+                derate_tables = tables.derates[derates[derate]]
+                if self.table == 'n1':
+                    result[rows] = find_n1_batch(columns['assumed_temp'][rows], columns['press_altitude'][rows],
+                                                 columns['oat'][rows], columns['bleeds'][rows], derate_tables)
+                else:
+                    result[rows] = find_trim_batch(columns['weight'][rows], columns['cg'][rows], derate_tables)
+            columns[self.table] = result
+            yield columns
+
+
+def _fields(columns: dict[str, np.ndarray], null: str, true: str, false: str, quote: str) -> list[list[str]]:
+    """
+    Every column as a list of formatted fields.
+    Results repeat a few values many times, so only the distinct ones are formatted.
+    """
+    fields = []
+    for values in columns.values():
+        distinct, inverse = np.unique(values, return_inverse=True)
+        if values.dtype == bool:
+            formatted = [true if value else false for value in distinct.tolist()]
+        elif values.dtype.kind in 'US':
+            formatted = [f'{quote}{value}{quote}' for value in distinct.tolist()]
+        else:
+            formatted = [null if value != value else repr(value) for value in distinct.tolist()]
+        fields.append(np.array(formatted, dtype=object)[inverse].tolist())
+    return fields
+
+
+def encode_csv(columns: dict[str, np.ndarray], header: bool) -> bytes:
+    lines = [",".join(columns)] if header else []
+    lines.extend(map(",".join, zip(*_fields(columns, "", "true", "false", ""))))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def encode_ndjson(columns: dict[str, np.ndarray]) -> bytes:
+    keys = [json.dumps(name) + ":" for name in columns]
+    fields = [[key + field for field in column]
+              for key, column in zip(keys, _fields(columns, "null", "true", "false", '"'))]
+    return "".join(f"{{{line}}}\n" for line in map(",".join, zip(*fields))).encode()
+
+
+def encode_sweep(sweep: Sweep, tables: PerformanceTables, output_format: str,
+                 chunk_rows: int = SWEEP_CHUNK_ROWS) -> Iterator[bytes]:
+    """The sweep encoded as CSV, NDJSON or an Arrow IPC stream, one piece per chunk"""
+    if output_format == 'arrow':
+        yield from _encode_arrow(sweep, tables, chunk_rows)
+        return
+    for index, columns in enumerate(sweep.chunks(tables, chunk_rows)):
+        yield encode_csv(columns, header=index == 0) if output_format == 'csv' else encode_ndjson(columns)
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _encode_arrow(sweep: Sweep, tables: PerformanceTables, chunk_rows: int) -> Iterator[bytes]:
+    # optional, only needed for Arrow output
+    import pyarrow as pa
+
+    buffer = io.BytesIO()
+    writer = None
+    for columns in sweep.chunks(tables, chunk_rows):
+        # NaN results become nulls
+        batch = pa.record_batch([pa.array(values, from_pandas=True) for values in columns.values()],
+                                names=list(columns))
+        if writer is None:
+            writer = pa.ipc.new_stream(buffer, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(buffer)
+    if writer is not None:
+        writer.close()
+        yield _drain(buffer)
+
+
+def _drain(buffer: io.BytesIO) -> bytes:
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+# columns of a scenario file, N1 needs the first five and trim derate, weight and cg
+SCENARIO_COLUMNS = ('derate', 'assumed_temp', 'press_altitude', 'oat', 'bleeds', 'weight', 'cg')
+N1_COLUMNS = ('derate', 'assumed_temp', 'press_altitude', 'oat', 'bleeds')
+TRIM_COLUMNS = ('derate', 'weight', 'cg')
+
+_BOOLEANS = {'true': 1.0, '1': 1.0, '1.0': 1.0, 'yes': 1.0, 'false': 0.0, '0': 0.0, '0.0': 0.0, 'no': 0.0}
+
+
+def _numbers(values: Sequence) -> np.ndarray:
+    """Floats of a column, NaN for anything that is not a number"""
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    numbers = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            numbers[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return numbers
+
+
+def _booleans(values: Sequence) -> np.ndarray:
+    """1.0/0.0 of a column of true/false, 1/0 or yes/no, NaN for anything else"""
+    distinct, inverse = np.unique(np.array(values, dtype=str), return_inverse=True)
+    return np.array([_BOOLEANS.get(value.strip().lower(), np.nan) for value in distinct.tolist()])[inverse]
+
+
+def evaluate_scenarios(columns: dict[str, Sequence], tables: PerformanceTables) -> dict[str, np.ndarray]:
+    """
+    N1 as `/takeoff/derate` and trim as `/takeoff/trim` compute them, for every
+    scenario of `columns`. NaN where a value is missing, invalid or outside the tables.
+    """
+    count = len(columns['derate'])
+    derate = np.array([str(value) for value in columns['derate']])
+    results = {}
+    if all(name in columns for name in N1_COLUMNS):
+        assumed_temp, press_altitude, oat = (_numbers(columns[name]) for name in ('assumed_temp', 'press_altitude', 'oat'))
+        bleeds = _booleans(columns['bleeds'])
+        n1 = np.full(count, np.nan)
+        for name, thrust in derates.items():
+            rows = (derate == name) & ~np.isnan(bleeds)
+            if rows.any():
+                n1[rows] = find_n1_batch(assumed_temp[rows], press_altitude[rows], oat[rows], bleeds[rows] == 1,
+                                         tables.derates[thrust])
+        results['n1'] = n1
+    if all(name in columns for name in TRIM_COLUMNS):
+        weight, cg = _numbers(columns['weight']), _numbers(columns['cg'])
+        trim = np.full(count, np.nan)
+        for name, thrust in derates.items():
+            rows = derate == name
+            if rows.any() and tables.derates[thrust].stab_trim is not None:
+                trim[rows] = find_trim_batch(weight[rows], cg[rows], tables.derates[thrust])
+        results['trim'] = trim
+    return results
+
+
+def scenario_header(header_line: str) -> list[str]:
+    """Column names of a CSV scenario file"""
+    return [name.strip() for name in next(csv.reader([header_line]))]
+
+
+def result_columns(header: list[str]) -> list[str]:
+    """Columns a CSV scenario file with `header` gets appended"""
+    return [name for name, needed in (('n1', N1_COLUMNS), ('trim', TRIM_COLUMNS))
+            if all(column in header for column in needed)]
+
+
+def process_csv_scenarios(lines: list[str], header: list[str], tables: PerformanceTables | None = None) -> bytes:
+    """Every scenario line of a CSV file, unchanged, with its results appended"""
+    lines = [line.rstrip('\r\n') for line in lines if line.strip()]
+    if not lines or not result_columns(header):
+        return "".join(line + "\n" for line in lines).encode()
+    # transposed, short rows padded with empty fields
+    fields = list(itertools.zip_longest(*csv.reader(lines), fillvalue=''))
+    columns = {
+        name: fields[header.index(name)] if header.index(name) < len(fields) else ('',) * len(lines)
+        for name in SCENARIO_COLUMNS if name in header
+    }
+    results = evaluate_scenarios(columns, tables or _worker_tables())
+    fields = _fields(results, "", "true", "false", "")
+    return "".join(f"{line},{','.join(values)}\n" for line, *values in zip(lines, *fields)).encode()
+
+
+def process_ndjson_scenarios(lines: list[str], tables: PerformanceTables | None = None) -> bytes:
+    """
+    Every scenario line of an NDJSON file with "n1" and "trim" added to the
+    records that hold their inputs, null when they cannot be computed. A line
+    that is not a JSON object is answered with {"error": ..., "input": line}.
+    """
+    lines = [line.strip() for line in lines if line.strip()]
+    if not lines:
+        return b""
+    records = []
+    errors = {}
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            errors[i] = f"invalid JSON: {exc}"
+            record = {}
+        if not isinstance(record, dict):
+            errors[i] = "expected a JSON object"
+            record = {}
+        records.append(record)
+    columns = {name: [record.get(name) for record in records] for name in SCENARIO_COLUMNS}
+    results = evaluate_scenarios(columns, tables or _worker_tables())
+    fields = dict(zip(results, _fields(results, "null", "true", "false", '"')))
+    out = []
+    for i, (line, record) in enumerate(zip(lines, records)):
+        if i in errors:
+            out.append(json.dumps({"error": errors[i], "input": line}) + "\n")
+            continue
+        added = "".join(
+            f',"{name}":{fields[name][i]}' for name, needed in (('n1', N1_COLUMNS), ('trim', TRIM_COLUMNS))
+            if all(column in record for column in needed))
+        if added:
+            line = f"{{{added[1:]}}}" if not record else line[:-1] + added + "}"
+        out.append(line + "\n")
+    return "".join(out).encode()
+
+
+_tables: PerformanceTables | None = None
+
+
+def _worker_tables() -> PerformanceTables:
+    """Tables of this process, loaded on first use so that pool workers load them once"""
+    global _tables
+    if _tables is None:
+        _tables = load_tables()
+    return _tables
@@ -0,0 +1,306 @@
+"""
+Benchmarks for the calculation engine and the HTTP/websocket endpoints.
+
+    python benchmark.py                          run everything, print JSON
+    python benchmark.py --output results.json    also write the results
+    python benchmark.py --save-baseline          store the results as the baseline
+    python benchmark.py --baseline base.json     compare against a baseline, exit 1 on regression
+    python benchmark.py --url http://host:8000   hit a running server instead of the in-process app
+    python benchmark.py --suite imports          import-time report (python -X importtime) and console startup
+
+Metrics ending in _us/_ms are lower-is-better, metrics ending in _per_s higher-is-better,
+any timed_out_* count above the baseline is a regression.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import tables
+from fake_xplane import DEFAULT_DATAREFS, FakeXPlane, Trajectory
+from performance import find_n1, find_n1_reduction, find_trim
+from telemetry import TAT_DATAREF, find_max_n1
+
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(SERVER_DIR, 'benchmark-baseline.json')
+
+
+def time_call(func, number: int = 2000, repeat: int = 5) -> float:
+    """Best per-call time of `func` in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+
+def percentiles(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+    }
+
+
+def bench_engine() -> dict:
+    """Single point interpolation for every table, per engine, plus loading costs"""
+    results = {
+        "load_tables": {"time_us": time_call(tables.load_tables, number=1, repeat=5)},
+        "load_tables_lut": {"time_us": time_call(lambda: tables.load_tables(engine='lut'), number=1, repeat=5)},
+    }
+    n1_df = tables.read_table(os.path.join(tables.TABLE_DIR, 'data-26K.csv'),
+                              ['Assumed Temperature (C)', 'Airport Pressure Altitude (ft)',
+                               'N1 (%)', 'Minimum Assumed Temperature (C)'])
+    results["create_interpolator"] = {"time_us": time_call(lambda: tables.create_interpolator(n1_df), number=50)}
+    results["read_csv"] = {"time_us": time_call(
+        lambda: tables.read_table(os.path.join(tables.TABLE_DIR, 'data-26K.csv'),
+                                  ['Assumed Temperature (C)', 'Airport Pressure Altitude (ft)',
+                                   'N1 (%)', 'Minimum Assumed Temperature (C)']), number=50)}
+
+    for engine in tables.INTERP_ENGINES:
+        snapshot = tables.load_tables(engine=engine)
+        derate_tables = snapshot.derates['26K']
+        results[f"find_n1_{engine}"] = {"time_us": time_call(lambda: find_n1(2500, 42, derate_tables.n1))}
+        results[f"find_n1_reduction_{engine}"] = {
+            "time_us": time_call(lambda: find_n1_reduction(27, 15, derate_tables.n1_reduction))}
+        results[f"find_trim_{engine}"] = {"time_us": time_call(lambda: find_trim(62000, 21.5, derate_tables.stab_trim))}
+        results[f"find_max_n1_{engine}"] = {"time_us": time_call(lambda: find_max_n1(-12.5, 23000, snapshot.max_climb_n1))}
+    return results
+
+
+def random_takeoff_request() -> dict:
+    return {
+        "derate": random.choice(["TO", "TO-1", "TO-2"]),
+        "assumed_temp": random.randint(30, 60),
+        "press_altitude": random.randint(0, 8000),
+        "oat": random.randint(0, 25),
+        "bleeds": random.choice([True, False]),
+    }
+
+
+def random_trim_request() -> dict:
+    return {
+        "derate": random.choice(["TO", "TO-1"]),
+        "weight": random.randint(40000, 78000),
+        "cg": random.randint(8, 30),
+    }
+
+
+def bench_http(client, clients: int = 8, requests_per_client: int = 200) -> dict:
+    """Throughput and latency of the calculation endpoints under concurrent clients"""
+    results = {}
+    for name, path, make_body in (
+            ("takeoff_derate", "/takeoff/derate", random_takeoff_request),
+            ("takeoff_trim", "/takeoff/trim", random_trim_request)):
+        def run_client(_):
+            latencies = []
+            for _ in range(requests_per_client):
+                body = make_body()
+                start = time.perf_counter()
+                client.post(path, json=body).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            latencies = [latency for client_latencies in pool.map(run_client, range(clients))
+                         for latency in client_latencies]
+        elapsed = time.perf_counter() - start
+        results[name] = {"requests_per_s": len(latencies) / elapsed, **percentiles(latencies)}
+    return results
+
+
+def alternating(low: float, high: float) -> Trajectory:
+    """Trajectory flipping between `low` and `high` on every sample"""
+    values = itertools.cycle((low, high))
+    return lambda _t: next(values)
+
+
+def receive_json(websocket, timeout: float):
+    """`receive_json` of a test client websocket, raising TimeoutError when nothing arrives within `timeout`"""
+    message = websocket.portal.call(asyncio.wait_for, websocket._send_rx.receive(), timeout)
+    websocket._raise_on_close(message)
+    return json.loads(message["text"])
+
+
+def bench_websocket(client, main_module, clients: int = 20, duration: float = 3.0, timeout: float = 2.0) -> dict:
+    """
+    max_n1_ws fan-out: every client subscribes and counts the pushed updates.
+    The TAT moves 10 C on every packet, past the 0.5 C deadband the clients ask
+    for, so every telemetry update is pushed. A client that gets nothing for
+    `timeout` seconds stops and counts as timed out.
+    """
+    datarefs = {**DEFAULT_DATAREFS, TAT_DATAREF: alternating(10.0, 20.0)}
+    with FakeXPlane(datarefs):
+        # wait for discovery and the first telemetry packet
+        deadline = time.monotonic() + 10
+        while not main_module.telemetry_hub.latest.connected and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        received = [0] * clients
+        timed_out = [False] * clients
+        cpu_start = time.process_time()
+
+        def run_client(index):
+            with client.websocket_connect("/x-plane/max-n1-ws") as websocket:
+                websocket.send_json({"request": "sub_max_n1", "tat_deadband": 0.5})
+                end = time.monotonic() + duration
+                while time.monotonic() < end:
+                    try:
+                        receive_json(websocket, timeout)
+                    except TimeoutError:
+                        timed_out[index] = True
+                        break
+                    received[index] += 1
+
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(run_client, range(clients)))
+        cpu = time.process_time() - cpu_start
+
+    total = sum(received)
+    return {"max_n1_ws": {
+        "clients": clients,
+        "messages_per_s": total / duration,
+        "min_client_messages_per_s": min(received) / duration,
+        "timed_out_clients": sum(timed_out),
+        "cpu_per_message_us": cpu / max(total, 1) * 1e6,
+    }}
+
+
+def import_times(module: str) -> list[tuple[str, int, int]]:
+    """(module, self us, cumulative us) of every import made by `import module` in a fresh interpreter"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                             cwd=SERVER_DIR, capture_output=True, text=True, check=True)
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def bench_imports(modules: tuple[str, ...] = ('performance', 'tables', 'main'), repeat: int = 3, top: int = 8) -> dict:
+    """Cold import time of the server modules and startup of takeoff-console.py"""
+    results = {}
+    for module in modules:
+        runs = [import_times(module) for _ in range(repeat)]
+        best = min(runs, key=lambda times: times[-1][2])
+        heaviest = sorted(best, key=lambda entry: entry[1], reverse=True)[:top]
+        results[f"import_{module}"] = {
+            "time_ms": best[-1][2] / 1e3,
+            "heaviest_self_ms": {name: self_us / 1e3 for name, self_us, _cumulative in heaviest},
+        }
+
+    def run(args: list[str], stdin: str = '') -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=SERVER_DIR, input=stdin, capture_output=True, text=True, check=True)
+        return time.perf_counter() - start
+
+    interpreter = min(run(['-c', 'pass']) for _ in range(repeat))
+    console = min(run(['takeoff-console.py'], "TO\n2500\n42\n") for _ in range(repeat))
+    results["console_startup"] = {
+        "time_ms": console * 1e3,
+        "over_interpreter_ms": (console - interpreter) * 1e3,
+    }
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Human readable regressions of `results` against `baseline`"""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if metric.startswith("timed_out") and value > (base or 0):
+                regressions.append(f"{name}.{metric}: {value} vs baseline {base or 0}")
+                continue
+            if not isinstance(base, (int, float)) or not isinstance(value, (int, float)) or not base:
+                continue
+            if metric.endswith(("_us", "_ms")) and value > base * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {value:.3f} vs baseline {base:.3f}")
+            elif metric.endswith("_per_s") and value < base * (1 - threshold):
+                regressions.append(f"{name}.{metric}: {value:.3f} vs baseline {base:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', choices=('engine', 'http', 'websocket', 'imports'), action='append',
+                        help="suites to run, default all")
+    parser.add_argument('--url', help="base URL of a running server, default the in-process app")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="requests per HTTP client")
+    parser.add_argument('--ws-clients', type=int, default=20)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline', help=f"baseline JSON, default {os.path.basename(BASELINE_FILE)} if present")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.10, help="allowed relative slowdown")
+    args = parser.parse_args()
+    suites = args.suite or ['engine', 'http', 'websocket', 'imports']
+
+    results = {}
+    if 'imports' in suites:
+        results.update(bench_imports())
+    if 'engine' in suites:
+        results.update(bench_engine())
+    if 'http' in suites or 'websocket' in suites:
+        import main as main_module
+
+        if args.url:
+            import httpx
+
+            client_context = httpx.Client(base_url=args.url)
+        else:
+            from fastapi.testclient import TestClient
+
+            client_context = TestClient(main_module.app)
+        with client_context as client:
+            if 'http' in suites:
+                results.update(bench_http(client, args.clients, args.requests))
+            if 'websocket' in suites and not args.url:
+                results.update(bench_websocket(client, main_module, args.ws_clients))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "engine": os.environ.get('TAKEOFF_INTERP_ENGINE', 'grid'),
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    baseline_file = args.baseline or (BASELINE_FILE if os.path.exists(BASELINE_FILE) and not args.save_baseline else None)
+    if baseline_file:
+        with open(baseline_file) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Dense lookup tables for the 2D performance charts.
+A `GridTable` is resampled once onto a uniform grid so that finding
+the cell of a point is plain arithmetic instead of a `searchsorted`.
+`DenseLUT` is called the same way as the interpolator it replaces.
+"""
+
+from functools import reduce
+from math import gcd
+
+import numpy as np
+
+from performance import GridTable
+
+
+# upper bound of samples per axis when a table's breakpoints share no usable step
+MAX_AXIS_POINTS = 2048
+
+
+def uniform_axis(breakpoints: np.ndarray, max_points: int = MAX_AXIS_POINTS) -> np.ndarray:
+    """
+    Uniform axis spanning `breakpoints`.
+    When every breakpoint is an integer the step is the gcd of their spacing, so every
+    original breakpoint lands on the new axis and bilinear resampling is exact.
+    """
+    low, high = float(breakpoints[0]), float(breakpoints[-1])
+    if np.all(breakpoints == np.round(breakpoints)):
+        step = reduce(gcd, np.diff(breakpoints).astype(int).tolist())
+        points = int(round((high - low) / step)) + 1
+        if points <= max_points:
+            return np.linspace(low, high, points)
+
+    return np.linspace(low, high, max_points)
+
+
+class DenseLUT:
+    """Bilinear lookup over a uniformly resampled 2D table"""
+
+    def __init__(self, interp_func: GridTable, max_points: int = MAX_AXIS_POINTS):
+        x_axis = uniform_axis(np.asarray(interp_func.grid[0], dtype=float), max_points)
+        y_axis = uniform_axis(np.asarray(interp_func.grid[1], dtype=float), max_points)
+        self.grid = (x_axis, y_axis)
+
+        x_mesh, y_mesh = np.meshgrid(x_axis, y_axis, indexing='ij')
+        self.values = interp_func((x_mesh, y_mesh)).astype(float)
+        # plain lists index faster than numpy arrays for the single point path
+        self._rows = self.values.tolist()
+
+        self.x_min, self.x_max = float(x_axis[0]), float(x_axis[-1])
+        self.y_min, self.y_max = float(y_axis[0]), float(y_axis[-1])
+        self.x_scale = (len(x_axis) - 1) / (self.x_max - self.x_min)
+        self.y_scale = (len(y_axis) - 1) / (self.y_max - self.y_min)
+        self.x_last_cell = len(x_axis) - 2
+        self.y_last_cell = len(y_axis) - 2
+
+        self.max_error = error_bound(self, interp_func)
+
+    def __call__(self, xi):
+        if isinstance(xi, tuple):
+            x, y = xi
+            if np.ndim(x) == 0 and np.ndim(y) == 0:
+                return self.find(float(x), float(y))
+            points = np.stack(np.broadcast_arrays(x, y), axis=-1)
+        else:
+            points = np.asarray(xi, dtype=float)
+            if points.ndim == 1:
+                return self.find(float(points[0]), float(points[1]))
+
+        flat = points.reshape(-1, 2).astype(float)
+        return self.find_many(flat[:, 0], flat[:, 1]).reshape(points.shape[:-1])
+
+    def find(self, x: float, y: float) -> float:
+        """Bilinear interpolation of a single point"""
+        if not (self.x_min <= x <= self.x_max and self.y_min <= y <= self.y_max):
+            raise ValueError("One of the requested xi is out of bounds")
+
+        fx = (x - self.x_min) * self.x_scale
+        fy = (y - self.y_min) * self.y_scale
+        i = min(int(fx), self.x_last_cell)
+        j = min(int(fy), self.y_last_cell)
+        tx = fx - i
+        ty = fy - j
+
+        row, next_row = self._rows[i], self._rows[i + 1]
+        return (row[j] * (1 - tx) + next_row[j] * tx) * (1 - ty) \
+            + (row[j + 1] * (1 - tx) + next_row[j + 1] * tx) * ty
+
+    def find_many(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Bilinear interpolation of arrays of points"""
+        if np.any((x < self.x_min) | (x > self.x_max) | (y < self.y_min) | (y > self.y_max)):
+            raise ValueError("One of the requested xi is out of bounds")
+
+        fx = (x - self.x_min) * self.x_scale
+        fy = (y - self.y_min) * self.y_scale
+        i = np.minimum(fx.astype(int), self.x_last_cell)
+        j = np.minimum(fy.astype(int), self.y_last_cell)
+        tx = fx - i
+        ty = fy - j
+
+        values = self.values
+        return (values[i, j] * (1 - tx) + values[i + 1, j] * tx) * (1 - ty) \
+            + (values[i, j + 1] * (1 - tx) + values[i + 1, j + 1] * tx) * ty
+
+
+def error_bound(lut: DenseLUT, interp_func: GridTable, samples: int = 4) -> float:
+    """
+    Largest absolute difference between `lut` and `interp_func`, probed at
+    `samples` evenly spaced points inside every cell of the dense grid.
+    """
+    probes = []
+    for axis in lut.grid:
+        offsets = (np.arange(samples) + 0.5) / samples
+        probes.append((axis[:-1, None] + np.diff(axis)[:, None] * offsets).ravel())
+
+    x_mesh, y_mesh = np.meshgrid(*probes, indexing='ij')
+    expected = interp_func((x_mesh, y_mesh))
+    return float(np.max(np.abs(lut.find_many(x_mesh.ravel(), y_mesh.ravel()).reshape(x_mesh.shape) - expected)))
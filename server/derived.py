@@ -0,0 +1,84 @@
+"""
+Incremental graph of values derived from raw inputs such as datarefs.
+Setting an input to a new value only marks the nodes depending on it dirty, a
+dirty node is recomputed the first time it is read afterwards. Reading a node
+whose inputs have not changed returns the cached value, so adding an output
+costs nothing until something reads it.
+"""
+
+from typing import Any, Callable, Iterable, Mapping
+
+import metrics
+
+
+class DerivedGraph:
+    """
+    Inputs are set from outside, nodes are computed from inputs and other nodes.
+    A node is None while any of its inputs is missing or None.
+    """
+
+    def __init__(self):
+        self._inputs: dict[str, tuple[str, ...]] = {}  # key = node, value = names it is computed from
+        self._compute: dict[str, Callable[..., Any]] = {}
+        self._dependents: dict[str, list[str]] = {}  # key = input or node, value = nodes computed from it
+        self._values: dict[str, Any] = {}
+        self._dirty: set[str] = set()
+
+    def derive(self, name: str, inputs: Iterable[str], compute: Callable[..., Any]):
+        """Add node `name`, computed as compute(*values of inputs). Nodes read by `name` must be added first"""
+        if name in self._compute or name in self._dependents:
+            raise ValueError(f"{name!r} is already an input or a node of the graph")
+        self._inputs[name] = tuple(inputs)
+        self._compute[name] = compute
+        for source in self._inputs[name]:
+            self._dependents.setdefault(source, []).append(name)
+        self._dirty.add(name)
+
+    def set(self, name: str, value: Any) -> bool:
+        """Set input `name`, True if it changed and its dependents are now dirty"""
+        if name in self._compute:
+            raise ValueError(f"{name!r} is computed by the graph")
+        if name in self._values and (self._values[name] is value or self._values[name] == value):
+            return False
+        self._values[name] = value
+        self._invalidate(name)
+        return True
+
+    def unset(self, name: str) -> bool:
+        """Forget input `name`, True if it was set"""
+        if name not in self._values or name in self._compute:
+            return False
+        del self._values[name]
+        self._invalidate(name)
+        return True
+
+    def update(self, values: Mapping[str, Any], names: Iterable[str]) -> bool:
+        """Set every input of `names` from `values`, unsetting those missing. True if any changed"""
+        changed = False
+        for name in names:
+            if name in values:
+                changed |= self.set(name, values[name])
+            else:
+                changed |= self.unset(name)
+        return changed
+
+    def _invalidate(self, name: str):
+        # a dirty node's dependents are dirty already, the walk stops there
+        stack = list(self._dependents.get(name, ()))
+        while stack:
+            node = stack.pop()
+            if node not in self._dirty:
+                self._dirty.add(node)
+                stack.extend(self._dependents.get(node, ()))
+
+    def is_dirty(self, name: str) -> bool:
+        return name in self._dirty
+
+    def get(self, name: str) -> Any:
+        """Value of input or node `name`, recomputing the node and its inputs if they are dirty"""
+        if name in self._dirty:
+            args = [self.get(source) for source in self._inputs[name]]
+            self._values[name] = None if any(arg is None for arg in args) else self._compute[name](*args)
+            self._dirty.discard(name)
+            metrics.derived_computations.inc(label=name)
+        return self._values.get(name)
@@ -0,0 +1,123 @@
+"""
+Acknowledged dataref writes. X-Plane does not answer a DREF, so every written
+dataref is held on the RREF stream for as long as the write takes, overlapping
+writes and permanent subscriptions keep it streaming after one of them is done.
+A write counts as confirmed once a packet received after it carries the
+written value. The writes go out as one paced burst, whatever is not confirmed
+within `wait` is sent again as another burst, along with the subscriptions of
+datarefs that never streamed back.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Mapping
+
+import metrics
+from shared_xplane import SharedXPlaneConnection
+from xplane_connection import XPlaneConnection
+
+
+# read-back values within this fraction of the written value, at least this much, count as confirmed.
+# DREF and RREF values travel as 32 bit floats
+READ_BACK_TOLERANCE = 1e-4
+
+
+@dataclass(frozen=True)
+class WriteConfirmation:
+    dataref: str
+    value: float
+    confirmed: bool
+    latency: float | None  # seconds from the first send to the read-back packet, None if unconfirmed
+    attempts: int
+    read_back: float | None  # last value X-Plane sent for the dataref
+
+    def to_message(self) -> dict:
+        return {
+            "dataref": self.dataref,
+            "value": self.value,
+            "confirmed": self.confirmed,
+            "latency": self.latency,
+            "attempts": self.attempts,
+            "read_back": self.read_back,
+        }
+
+
+def read_back_matches(read_back: float | None, value: float) -> bool:
+    return read_back is not None and abs(read_back - value) <= READ_BACK_TOLERANCE * max(1.0, abs(value))
+
+
+async def write_confirmed(xplane: XPlaneConnection | SharedXPlaneConnection,
+                          values: Mapping[str, float | int | bool], wait: float = 0.5, retries: int = 2,
+                          timeout: float = 3.0) -> list[WriteConfirmation]:
+    """
+    Write `values` and wait up to `wait` seconds for X-Plane to stream every one
+    of them back, resending the unconfirmed ones up to `retries` times.
+    Confirmations come in the order of `values`. Raises `XPlaneIpNotFound` when
+    X-Plane is not discovered within `timeout`.
+    """
+    values = {dataref: float(value) for dataref, value in values.items()}
+    xplane.hold(*values)
+    try:
+        return await _write_confirmed(xplane, values, wait, retries, timeout)
+    finally:
+        xplane.release(*values)
+
+
+async def _write_confirmed(xplane: XPlaneConnection | SharedXPlaneConnection, values: dict[str, float],
+                           wait: float, retries: int, timeout: float) -> list[WriteConfirmation]:
+    await xplane.wait_connected(timeout)
+
+    packet = asyncio.Event()
+
+    def packet_received(_xplane):
+        packet.set()
+
+    first_sent: dict[str, float] = {}
+    attempts = dict.fromkeys(values, 0)
+    confirmed: dict[str, WriteConfirmation] = {}
+    pending = dict(values)
+    xplane.add_listener(packet_received)
+    try:
+        for attempt in range(retries + 1):
+            if attempt:
+                metrics.dref_writes.inc(len(pending), label="retried")
+                # the RREF request of a dataref that never streamed back may have been lost too
+                xplane.resubscribe(*[dataref for dataref in pending if xplane.updated_at(dataref) is None])
+            sent = time.monotonic()
+            await xplane.write_data_refs(pending, timeout)
+            for dataref in pending:
+                attempts[dataref] += 1
+                first_sent.setdefault(dataref, sent)
+
+            deadline = time.monotonic() + wait
+            while True:
+                for dataref in list(pending):
+                    updated = xplane.updated_at(dataref)
+                    read_back = xplane.values.get(dataref)
+                    if updated is not None and updated >= sent and read_back_matches(read_back, values[dataref]):
+                        latency = updated - first_sent[dataref]
+                        confirmed[dataref] = WriteConfirmation(
+                            dataref, values[dataref], True, latency, attempts[dataref], read_back)
+                        metrics.stage_seconds.observe('dref_confirmation', latency)
+                        del pending[dataref]
+                remaining = deadline - time.monotonic()
+                if not pending or remaining <= 0:
+                    break
+                packet.clear()
+                try:
+                    await asyncio.wait_for(packet.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if not pending:
+                break
+    finally:
+        xplane.remove_listener(packet_received)
+
+    metrics.dref_writes.inc(len(confirmed), label="confirmed")
+    metrics.dref_writes.inc(len(pending), label="unconfirmed")
+    return [
+        confirmed.get(dataref) or WriteConfirmation(
+            dataref, value, False, None, attempts[dataref], xplane.values.get(dataref))
+        for dataref, value in values.items()
+    ]
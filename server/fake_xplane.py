@@ -0,0 +1,280 @@
+"""
+Local X-Plane stand-in for load and latency testing.
+Speaks the wire formats `XPlaneUdp` parses: multicasts BECN beacons, answers RREF
+subscriptions at their requested frequency with scripted or recorded dataref
+trajectories and accepts DREF/CMND writes. Packet loss, latency and the number
+of datarefs are configurable.
+
+    python fake_xplane.py --datarefs 2000 --loss 0.01 --latency 0.02
+    python fake_xplane.py --recording session.csv
+"""
+
+import argparse
+import csv
+import heapq
+import math
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from typing import Callable
+
+from x_plane_udp import MAX_PACKET_SIZE, MCAST_GRP, MCAST_PORT
+
+
+# dataref records that fit in one RREF answer
+RECORDS_PER_PACKET = (MAX_PACKET_SIZE - 5) // 8
+
+# a dataref is either a fixed value or a function of the seconds since start
+Trajectory = float | Callable[[float], float]
+
+DEFAULT_DATAREFS: dict[str, Trajectory] = {
+    "sim/flightmodel/weight/m_total": 65000.0,
+    "sim/cockpit2/gauges/indicators/CG_indicator": 0.2,
+    "sim/weather/barometer_current_inhg": lambda t: 29.92 - 0.5 * (1 - math.cos(t / 60)),
+    "sim/cockpit2/temperature/outside_air_temp_deg": lambda t: 15 - 20 * (1 - math.cos(t / 60)),
+    "sim/flightmodel2/position/pressure_altitude": lambda t: 5000 * (1 - math.cos(t / 60)),
+}
+
+
+def synthetic_datarefs(count: int) -> dict[str, Trajectory]:
+    """`count` extra datarefs, each a sine wave with its own period"""
+    return {
+        f"sim/fake/value[{i}]": (lambda t, period=1 + i % 17: math.sin(t / period))
+        for i in range(count)
+    }
+
+
+def load_recording(path: str, loop: bool = True) -> dict[str, Trajectory]:
+    """
+    Trajectories from a CSV with a `time` column (seconds) and one column per dataref.
+    Values are interpolated linearly between samples and the recording loops.
+    """
+    with open(path, newline='') as file:
+        rows = list(csv.DictReader(file))
+    times = [float(row['time']) for row in rows]
+    duration = times[-1] - times[0]
+
+    def trajectory(column: str) -> Trajectory:
+        samples = [float(row[column]) for row in rows]
+
+        def value_at(t: float) -> float:
+            t = times[0] + (t % duration if loop and duration > 0 else min(t, duration))
+            i = max(0, min(len(times) - 2, _bisect(times, t)))
+            span = times[i + 1] - times[i]
+            weight = (t - times[i]) / span if span else 0.0
+            return samples[i] + (samples[i + 1] - samples[i]) * weight
+
+        return value_at if len(rows) > 1 else samples[0]
+
+    return {column: trajectory(column) for column in rows[0] if column != 'time'}
+
+
+def _bisect(times: list[float], t: float) -> int:
+    low, high = 0, len(times) - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if times[middle] <= t:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class FakeXPlane:
+    """
+    Fake simulator running on a background thread.
+    `writes` and `commands` record every DREF and CMND received, a DREF also
+    overrides the dataref's trajectory from then on.
+    """
+
+    def __init__(self, datarefs: dict[str, Trajectory] | None = None, port: int = 49000,
+                 hostname: str = "fake-xplane", version: int = 120012, beacon_interval: float = 1.0,
+                 loss: float = 0.0, latency: float = 0.0, jitter: float = 0.0, seed: int | None = None):
+        self.datarefs: dict[str, Trajectory] = dict(DEFAULT_DATAREFS if datarefs is None else datarefs)
+        self.port = port
+        self.hostname = hostname
+        self.version = version
+        self.beacon_interval = beacon_interval
+        # probability of dropping any packet sent or received
+        self.loss = loss
+        # delay of every packet sent, plus up to `jitter` seconds at random
+        self.latency = latency
+        self.jitter = jitter
+        self.writes: list[tuple[float, str, float]] = []
+        self.commands: list[tuple[float, str]] = []
+        self.packets_sent = 0
+        self.packets_dropped = 0
+        self._random = random.Random(seed)
+        # key = client address, value = {idx: (dataref, freq)}
+        self._subscriptions: dict[tuple[str, int], dict[int, tuple[str, int]]] = {}
+        # (due, client address, freq) for every frequency a client subscribed at
+        self._schedule: list[tuple[float, tuple[str, int], int]] = []
+        self._outbox: list[tuple[float, int, bytes, tuple[str, int]]] = []
+        self._sequence = 0
+        self._start = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._start = time.monotonic()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(('0.0.0.0', self.port))
+        self._socket.setblocking(False)
+        self._beacon_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._beacon_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self._thread = threading.Thread(target=self._run, name="fake-xplane", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+        self._beacon_socket.close()
+
+    @property
+    def subscription_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def value(self, dataref: str, now: float | None = None) -> float:
+        trajectory = self.datarefs.get(dataref, 0.0)
+        if callable(trajectory):
+            elapsed = (time.monotonic() if now is None else now) - self._start
+            return float(trajectory(elapsed))
+        return float(trajectory)
+
+    def beacon_packet(self) -> bytes:
+        # beacon 1.2, X-Plane (1), master role (1)
+        return b"BECN\x00" + struct.pack("<BBiiIH", 1, 2, 1, self.version, 1, self.port) \
+            + self.hostname.encode() + b"\x00"
+
+    def _lost(self) -> bool:
+        if self.loss and self._random.random() < self.loss:
+            self.packets_dropped += 1
+            return True
+        return False
+
+    def _send(self, packet: bytes, addr: tuple[str, int], sock: socket.socket | None = None):
+        if self._lost():
+            return
+        if not self.latency and not self.jitter:
+            (sock or self._socket).sendto(packet, addr)
+            self.packets_sent += 1
+            return
+        due = time.monotonic() + self.latency + self._random.random() * self.jitter
+        self._sequence += 1
+        heapq.heappush(self._outbox, (due, self._sequence, packet, addr))
+
+    def _answer(self, addr: tuple[str, int], freq: int, now: float):
+        records = [
+            struct.pack("<if", idx, self.value(dataref, now))
+            for idx, (dataref, dataref_freq) in self._subscriptions.get(addr, {}).items()
+            if dataref_freq == freq
+        ]
+        for start in range(0, len(records), RECORDS_PER_PACKET):
+            self._send(b"RREF," + b"".join(records[start:start + RECORDS_PER_PACKET]), addr)
+
+    def _received(self, data: bytes, addr: tuple[str, int]):
+        if self._lost():
+            return
+        now = time.monotonic()
+        header = data[0:5]
+        if header == b"RREF\x00":
+            freq, idx = struct.unpack("<ii", data[5:13])
+            dataref = data[13:].split(b"\x00", 1)[0].decode()
+            subscriptions = self._subscriptions.setdefault(addr, {})
+            if freq <= 0:
+                subscriptions.pop(idx, None)
+                return
+            scheduled = any(dataref_freq == freq for _dataref, dataref_freq in subscriptions.values())
+            subscriptions[idx] = (dataref, freq)
+            if not scheduled:
+                heapq.heappush(self._schedule, (now, addr, freq))
+        elif header == b"DREF\x00":
+            (value,) = struct.unpack("<f", data[5:9])
+            dataref = data[9:].split(b"\x00", 1)[0].decode()
+            self.datarefs[dataref] = value
+            self.writes.append((now, dataref, value))
+        elif data[0:4] == b"CMND":
+            self.commands.append((now, data[5:].split(b"\x00", 1)[0].decode()))
+
+    def _run(self):
+        next_beacon = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_beacon:
+                self._send(self.beacon_packet(), (MCAST_GRP, MCAST_PORT), self._beacon_socket)
+                next_beacon = now + self.beacon_interval
+
+            while self._schedule and self._schedule[0][0] <= now:
+                _due, addr, freq = heapq.heappop(self._schedule)
+                subscriptions = self._subscriptions.get(addr, {})
+                if any(dataref_freq == freq for _dataref, dataref_freq in subscriptions.values()):
+                    self._answer(addr, freq, now)
+                    heapq.heappush(self._schedule, (max(_due + 1 / freq, now), addr, freq))
+
+            while self._outbox and self._outbox[0][0] <= now:
+                _due, _sequence, packet, addr = heapq.heappop(self._outbox)
+                sock = self._beacon_socket if addr == (MCAST_GRP, MCAST_PORT) else self._socket
+                sock.sendto(packet, addr)
+                self.packets_sent += 1
+
+            deadlines = [next_beacon, now + 0.05]
+            if self._schedule:
+                deadlines.append(self._schedule[0][0])
+            if self._outbox:
+                deadlines.append(self._outbox[0][0])
+            readable, _writable, _errors = select.select([self._socket], [], [], max(0.0, min(deadlines) - now))
+            if readable:
+                # drain everything queued so bulk subscriptions are handled in one pass
+                while True:
+                    try:
+                        data, addr = self._socket.recvfrom(MAX_PACKET_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    self._received(data, addr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=49000)
+    parser.add_argument('--hostname', default="fake-xplane")
+    parser.add_argument('--datarefs', type=int, default=0, help="extra synthetic datarefs")
+    parser.add_argument('--recording', help="CSV with a time column and one column per dataref")
+    parser.add_argument('--loss', type=float, default=0.0, help="packet loss probability")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every packet sent")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency in seconds")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    datarefs = dict(DEFAULT_DATAREFS)
+    datarefs.update(synthetic_datarefs(args.datarefs))
+    if args.recording:
+        datarefs.update(load_recording(args.recording))
+
+    with FakeXPlane(datarefs, port=args.port, hostname=args.hostname, loss=args.loss,
+                    latency=args.latency, jitter=args.jitter, seed=args.seed) as fake:
+        print(f"Fake X-Plane listening on port {args.port} with {len(datarefs)} datarefs")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"sent {fake.packets_sent} packets, dropped {fake.packets_dropped}, "
+                      f"{fake.subscription_count} subscriptions")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,153 @@
-import pandas as pd
+from contextlib import asynccontextmanager
+import logging
+import math
+import os
 from enum import Enum
-from scipy.interpolate import RegularGridInterpolator
-from pydantic import BaseModel
-from fastapi import FastAPI, WebSocket
+import numpy as np
+from pydantic import BaseModel, model_validator
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import socket
+import time
 from fastapi.middleware.cors import CORSMiddleware
-import websocket
-from x_plane_udp import XPlaneUdp, XPlaneIpNotFound
+import asyncio
+import metrics
+from x_plane_udp import XPlaneIpNotFound, XPlaneTimeout
+from xplane_connection import XPlaneConnection
+from shared_xplane import SharedXPlaneConnection
+from xplane_pool import XPlanePool
+from response_cache import LRUCache, cache_key
+from telemetry_recorder import TelemetryRecorder
+from telemetry_frames import SUBPROTOCOL, DeltaEncoder, schema_frame
+from dref_writes import write_confirmed
+from telemetry import (
+    BARO_DATAREF,
+    CG_DATAREF,
+    WEIGHT_DATAREF,
+    Deadband,
+    TelemetryHub,
+)
+from performance import (
+    DerateTables,
+    derate_n1,
+    derates,
+    stab_trim_setting,
+    takeoff_sheet,
+)
+from batch import SWEEP_FORMATS, Sweep, arrow_available, encode_sweep, find_n1_batch
+from tables import TableRegistry
+
+
+# TAKEOFF_LOG_LEVEL=DEBUG also logs every unknown packet and beacon
+logging.basicConfig(level=os.environ.get('TAKEOFF_LOG_LEVEL', 'INFO').upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# TAKEOFF_MULTI_WORKER=1 for `uvicorn --workers N`: every worker maps the same compiled
+# tables and one of them owns the X-Plane connection on behalf of the others
+multi_worker = os.environ.get('TAKEOFF_MULTI_WORKER', '') not in ('', '0')
+# set TAKEOFF_INTERP_ENGINE=lut to evaluate the tables through dense lookup tables
+table_registry = TableRegistry(engine=os.environ.get('TAKEOFF_INTERP_ENGINE', 'grid'), compile_pack=multi_worker)
+xplane = SharedXPlaneConnection(os.environ.get('TAKEOFF_IPC_PATH')) if multi_worker else XPlaneConnection()
+telemetry_hub = TelemetryHub(xplane, table_registry)
+# every other simulator on the network, picked with the `sim` selector of the
+# X-Plane endpoints. Sessions are per process, in multi worker mode every
+# worker would open its own and write to the simulator on its own, so the
+# selector is not available there
+xplane_pool = XPlanePool() if not multi_worker else None
+telemetry_hubs: dict[str, TelemetryHub] = {}
+# TAKEOFF_CACHE_TTL unset keeps responses until they are evicted or the tables reload
+response_cache = LRUCache(
+    maxsize=int(os.environ.get('TAKEOFF_CACHE_SIZE', 4096)),
+    ttl=float(os.environ['TAKEOFF_CACHE_TTL']) if 'TAKEOFF_CACHE_TTL' in os.environ else None,
+)
+table_registry.add_listener(lambda _tables: response_cache.clear())
+
 
-app = FastAPI(title="737-800W(B738) Performance Data and Manipulation API")
+def response_cache_metrics():
+    stats = response_cache.stats()
+    for name in ('hits', 'misses', 'evictions'):
+        yield f"# HELP takeoff_response_cache_{name}_total Response cache {name}"
+        yield f"# TYPE takeoff_response_cache_{name}_total counter"
+        yield f"takeoff_response_cache_{name}_total {stats[name]}"
+    yield "# HELP takeoff_response_cache_size Responses currently cached"
+    yield "# TYPE takeoff_response_cache_size gauge"
+    yield f"takeoff_response_cache_size {stats['size']}"
 
 
-origins = [
-    "http://localhost:4173",
-    "http://localhost:5173",
-    "http://localhost",
-    f"http://{socket.gethostbyname(socket.gethostname())}:5173",
-    f"http://{socket.gethostbyname(socket.gethostname())}:4173"
+metrics.add_collector(response_cache_metrics)
+
+# max N1 pushes per second and the TAT (C) / pressure altitude (ft) moves worth a push,
+# clients may ask for their own when they subscribe
+push_rate = float(os.environ.get('TAKEOFF_PUSH_RATE', 5))
+push_deadband = Deadband(
+    tat=float(os.environ.get('TAKEOFF_PUSH_TAT_DEADBAND', 0.5)),
+    press_alt=float(os.environ.get('TAKEOFF_PUSH_ALT_DEADBAND', 50)),
+)
+MAX_PUSH_RATE = 50
+# seconds a push may wait on a slow client before the client is dropped
+PUSH_SEND_TIMEOUT = 5.0
+
+# TAKEOFF_RECORD=session.tkrec records every RREF packet and derived snapshot, single worker only
+record_path = os.environ.get('TAKEOFF_RECORD') if not multi_worker else None
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    tables = table_registry.load()
+    if tables.engine == 'lut':
+        logger.info("Dense lookup tables loaded, max error %.2e", tables.lut_error_bound())
+    recorder = None
+    if record_path:
+        recorder = TelemetryRecorder(record_path)
+        xplane.on_packet = recorder.record_packet
+        telemetry_hub.add_listener(recorder.record_snapshot)
+        logger.info("Recording telemetry to %s", record_path)
+    telemetry_hub.start()
+    xplane.start()
+    if xplane_pool is not None:
+        await xplane_pool.start()
+    yield
+    for hub in telemetry_hubs.values():
+        hub.stop()
+    telemetry_hubs.clear()
+    if xplane_pool is not None:
+        await xplane_pool.stop()
+    await xplane.stop()
+    telemetry_hub.stop()
+    if recorder is not None:
+        telemetry_hub.remove_listener(recorder.record_snapshot)
+        xplane.on_packet = None
+        recorder.close()
+
+
+app = FastAPI(title="737-800W(B738) Performance Data and Manipulation API", lifespan=lifespan)
+
+
+def cors_origins() -> list[str]:
+    """Dev server origins on localhost and on this machine's address"""
+    origins = [
+        "http://localhost:4173",
+        "http://localhost:5173",
+        "http://localhost",
+    ]
+    # one resolver round trip, and none at all to fail startup when the hostname does not resolve
+    try:
+        host_ip = socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return origins
+    return origins + [f"http://{host_ip}:5173", f"http://{host_ip}:4173"]
 
-]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
+    allow_origins=cors_origins(),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 
-derates = {
-    'TO': '26K',
-    'TO-1': '24K',
-    'TO-2': '22K'
-}
-
-
 class TakeoffDerates(str, Enum):
     to = 'TO'
     to1 = 'TO-1'
@@ -54,9 +166,158 @@ class TrimCalculationRequest(BaseModel):
     cg: float
     derate: TakeoffDerates
 
+class TakeoffBatchRequest(BaseModel):
+    """One scenario per index, every list must have the same length"""
+    derate: list[TakeoffDerates]
+    assumed_temp: list[int]
+    press_altitude: list[int]
+    oat: list[int]
+    bleeds: list[bool]
+
+    @model_validator(mode='after')
+    def check_lengths(self):
+        lengths = {len(self.derate), len(self.assumed_temp), len(self.press_altitude),
+                   len(self.oat), len(self.bleeds)}
+        if len(lengths) != 1:
+            raise ValueError("All scenario lists must have the same length")
+        return self
+
+class AssumedTempRequest(BaseModel):
+    """One runway per index, every list must have the same length"""
+    derate: list[TakeoffDerates]
+    press_altitude: list[int]
+    oat: list[int]
+    target_n1: list[float]
+    bleeds: list[bool]
+
+    @model_validator(mode='after')
+    def check_lengths(self):
+        lengths = {len(self.derate), len(self.press_altitude), len(self.oat),
+                   len(self.target_n1), len(self.bleeds)}
+        if len(lengths) != 1:
+            raise ValueError("All runway lists must have the same length")
+        return self
+
 class DerateN1Request(BaseModel):
     derate_N1: float
 
+# datarefs a single write request may set
+MAX_DATAREF_WRITES = 64
+
+class DatarefWriteRequest(BaseModel):
+    """
+    Datarefs to write in one burst, e.g. the whole takeoff setup (N1 bug, stab
+    trim, V-speeds) under the names the loaded aircraft uses. Each write is
+    confirmed by reading it back, waiting `wait` seconds per attempt.
+    """
+    values: dict[str, float | bool]
+    wait: float = 0.5
+    retries: int = 2
+
+    @model_validator(mode='after')
+    def check_values(self):
+        if not 0 < len(self.values) <= MAX_DATAREF_WRITES:
+            raise ValueError(f"values must hold 1 to {MAX_DATAREF_WRITES} datarefs")
+        if not 0 < self.wait <= 5 or not 0 <= self.retries <= 5:
+            raise ValueError("wait must be above 0 and at most 5 seconds, retries between 0 and 5")
+        return self
+
+class TakeoffSheetRequest(BaseModel):
+    """Conditions left out are filled from X-Plane when `from_x_plane` is set"""
+    assumed_temp: int
+    bleeds: bool
+    press_altitude: float | None = None
+    oat: float | None = None
+    weight: float | None = None
+    cg: float | None = None
+    from_x_plane: bool = False
+    sim: str | None = None
+
+
+# values a single sweep axis may hold
+MAX_AXIS_VALUES = 100_000
+
+class AxisRange(BaseModel):
+    """Evenly spaced values from `start` to `stop`, both included"""
+    start: float
+    stop: float
+    step: float
+
+    @model_validator(mode='after')
+    def check_range(self):
+        if self.step <= 0 or self.stop < self.start:
+            raise ValueError("A range needs a positive step and a stop not below its start")
+        # checked as a float, a huge span over a tiny step overflows int()
+        steps = (self.stop - self.start) / self.step
+        if not math.isfinite(steps) or math.floor(steps + 1e-9) + 1 > MAX_AXIS_VALUES:
+            raise ValueError(f"A range can hold at most {MAX_AXIS_VALUES} values")
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(np.floor((self.stop - self.start) / self.step + 1e-9)) + 1
+
+    def values(self) -> np.ndarray:
+        return self.start + self.step * np.arange(self.count)
+
+class SweepTable(str, Enum):
+    n1 = 'n1'
+    trim = 'trim'
+
+class SweepFormat(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+    arrow = 'arrow'
+
+class TakeoffSweepRequest(BaseModel):
+    """
+    Axes of a grid sweep, every combination of their values is evaluated.
+    An axis is a list of values or a range. N1 sweeps take press_altitude,
+    assumed_temp and oat, trim sweeps weight and cg. Derates default to every
+    derate with a table.
+    """
+    table: SweepTable = SweepTable.n1
+    format: SweepFormat = SweepFormat.csv
+    derate: list[TakeoffDerates] | None = None
+    bleeds: list[bool] = [True, False]
+    press_altitude: AxisRange | list[float] | None = None
+    assumed_temp: AxisRange | list[float] | None = None
+    oat: AxisRange | list[float] | None = None
+    weight: AxisRange | list[float] | None = None
+    cg: AxisRange | list[float] | None = None
+
+    @model_validator(mode='after')
+    def check_axes(self):
+        required = ('press_altitude', 'assumed_temp', 'oat') if self.table == SweepTable.n1 else ('weight', 'cg')
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"A {self.table.value} sweep needs {', '.join(missing)}")
+        if self.table == SweepTable.trim and self.derate is not None \
+                and not set(self.derate) <= {TakeoffDerates.to, TakeoffDerates.to1}:
+            raise ValueError("Stab trim is only available for TO and TO-1")
+        return self
+
+    def axes(self) -> dict[str, list | np.ndarray]:
+        """Values of every axis in row order, the last one varying fastest"""
+        def values(axis: AxisRange | list[float]) -> np.ndarray:
+            return axis.values() if isinstance(axis, AxisRange) else np.array(axis, dtype=float)
+
+        if self.table == SweepTable.n1:
+            derate = self.derate or list(TakeoffDerates)
+            return {
+                'derate': [d.value for d in derate],
+                'bleeds': self.bleeds,
+                'press_altitude': values(self.press_altitude),
+                'assumed_temp': values(self.assumed_temp),
+                'oat': values(self.oat),
+            }
+        derate = self.derate or [TakeoffDerates.to, TakeoffDerates.to1]
+        return {
+            'derate': [d.value for d in derate],
+            'weight': values(self.weight),
+            'cg': values(self.cg),
+        }
+
 
 pressure_factor = {
     'hpa': 1/3386/100,
@@ -64,81 +325,141 @@ pressure_factor = {
 }
 
 
-def create_interpolator(df: pd.DataFrame):
-    """ creats an interpolation function to find N1 from an assumed dataset"""
-    unique_temps = df['Assumed Temperature (C)'].unique()
-    unique_alts = df['Airport Pressure Altitude (ft)'].unique()
-
-    # Create a 2D grid of the N1 values
-    n1_matrix = df.pivot(
-        index='Airport Pressure Altitude (ft)',
-        columns='Assumed Temperature (C)',
-        values='N1 (%)'
-    ).values
-
-    # Create the interpolation function
-
-    return RegularGridInterpolator((unique_alts, unique_temps), n1_matrix)
-
-def create_interpolator_stab_trim(df: pd.DataFrame):
-    unique_weights = df['Weight(kg)'].unique()
-    unique_cg_settings = df['CG(%MAC)'].unique()
-
-    trim_matrix = df.pivot(
-        index='Weight(kg)',
-        columns='CG(%MAC)',
-        values='Trim'
-    ).values
-
-    return RegularGridInterpolator((unique_weights, unique_cg_settings), trim_matrix)
-
-
-def create_interpolator_n1_reduction(df: pd.DataFrame):
-    unique_delta_assumed_temp = df['Assumed Temp Minus OAT'].unique()
-    unique_oat = df['OAT'].unique()
-
-    n1_red_matrix = df.pivot(
-        index='Assumed Temp Minus OAT',
-        columns='OAT',
-        values='N1(%) Reduction'
-    ).values
-
-    return RegularGridInterpolator((unique_delta_assumed_temp, unique_oat), n1_red_matrix)
-
-
-# Function to find N1 based on pressure altitude and assumed temperature
-
-
-def find_n1(pressure_altitude: float, assumed_temp: int, interp_func: RegularGridInterpolator):
-    """Alias function to find N1 using interpolation function"""
-    return interp_func((pressure_altitude, assumed_temp))
-
-def find_trim(weight: float, cg: float, interp_func: RegularGridInterpolator):
-    return interp_func((weight, cg))
-
-def find_n1_reduction(assumed_temp_minus_oat: int, oat: int, interp_func: RegularGridInterpolator):
-    return interp_func((assumed_temp_minus_oat, oat))
-
 @app.post('/takeoff/derate')
 def get_n1(takeoff_request: TakeoffCalculationRequest):
-    derate_database = pd.read_csv(f'data-{derates[takeoff_request.derate]}.csv')
-    
-        
-    
-    derate_database.columns = ['Assumed Temperature (C)', 'Airport Pressure Altitude (ft)',
-                               'N1 (%)', 'Minimum Assumed Temperature (C)']
-    n1 = find_n1(takeoff_request.press_altitude,
-                 takeoff_request.assumed_temp, create_interpolator(derate_database))
-    
-    n1_red = 0
-    n1_red_database = pd.read_csv(f'data-reduction-{derates[takeoff_request.derate]}.csv')
-    n1_red_database.columns = ['Assumed Temp Minus OAT', 'OAT', 'N1(%) Reduction']
-    n1_red = float(find_n1_reduction(takeoff_request.assumed_temp - takeoff_request.oat, takeoff_request.oat, create_interpolator_n1_reduction(n1_red_database)))
+    # touching the registry first lets a table reload invalidate the cache, keying by
+    # generation keeps a response computed from replaced tables from being served after it
+    tables = table_registry.tables
+    key = (tables.generation, cache_key(takeoff_request))
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    derate_tables = tables.derates[derates[takeoff_request.derate]]
+
+    with metrics.stage_seconds.time('interpolation'):
+        n1 = derate_n1(takeoff_request.press_altitude, takeoff_request.assumed_temp, takeoff_request.oat,
+                       takeoff_request.bleeds, derate_tables)
+
+    response = {
+        "success": True,
+        "message": "Success",
+        "n1": n1
+    }
+    response_cache.put(key, response)
+    return response
+
+@app.post('/takeoff/derate/batch')
+def get_n1_batch(batch_request: TakeoffBatchRequest):
+    tables = table_registry.tables
+    derate = np.array([d.value for d in batch_request.derate])
+    assumed_temp = np.array(batch_request.assumed_temp, dtype=float)
+    press_altitude = np.array(batch_request.press_altitude, dtype=float)
+    oat = np.array(batch_request.oat, dtype=float)
+    bleeds = np.array(batch_request.bleeds, dtype=bool)
+
+    n1 = np.full(len(derate), np.nan)
+    with metrics.stage_seconds.time('interpolation'):
+        for takeoff_derate in np.unique(derate):
+            rows = derate == takeoff_derate
+            n1[rows] = find_n1_batch(assumed_temp[rows], press_altitude[rows], oat[rows], bleeds[rows],
+                                     tables.derates[derates[takeoff_derate]])
+
+    out_of_range = np.isnan(n1)
+    return {
+        "success": True,
+        "message": "Success" if not out_of_range.any() else f"{int(out_of_range.sum())} scenarios outside the performance tables",
+        "n1": [None if missing else value for value, missing in zip(n1.tolist(), out_of_range.tolist())]
+    }
 
+def net_n1(assumed_temp: np.ndarray, press_altitude: np.ndarray, oat: np.ndarray, bleeds: np.ndarray,
+           derate_tables: DerateTables) -> np.ndarray:
+    """Unrounded N1 of `get_n1` for points known to be inside the tables, arguments broadcast"""
+    assumed_temp, press_altitude, oat, bleeds = np.broadcast_arrays(assumed_temp, press_altitude, oat, bleeds)
+    return derate_tables.n1(np.stack((press_altitude, assumed_temp), axis=-1)) \
+        - derate_tables.n1_reduction(np.stack((assumed_temp - oat, oat), axis=-1)) \
+        + np.where(bleeds, 0, 1)
+
+def assumed_temp_bounds(press_altitude: np.ndarray, oat: np.ndarray,
+                        derate_tables: DerateTables) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lowest and highest valid assumed temperature: from max(minimum assumed temperature, OAT)
+    to the top of the tables. NaN outside the tables.
+    """
+    n1_alts, n1_temps = derate_tables.n1.grid
+    red_deltas, red_oats = derate_tables.n1_reduction.grid
+    inside = (press_altitude >= n1_alts[0]) & (press_altitude <= n1_alts[-1]) \
+        & (oat >= red_oats[0]) & (oat <= red_oats[-1])
+    min_assumed_temp = np.full(len(press_altitude), np.nan)
+    min_assumed_temp[inside] = derate_tables.min_assumed_temp(press_altitude[inside, None])
+    low = np.maximum.reduce([np.full(len(oat), n1_temps[0]), min_assumed_temp, oat + red_deltas[0]])
+    high = np.minimum(n1_temps[-1], oat + red_deltas[-1])
+    return low, high
+
+def solve_assumed_temp(press_altitude: np.ndarray, oat: np.ndarray, target_n1: np.ndarray, bleeds: np.ndarray,
+                       derate_tables: DerateTables, iterations: int = 30) -> np.ndarray:
+    """
+    Highest assumed temperature whose N1 still reaches `target_n1`, NaN where none does.
+    Assumed temperatures run between `assumed_temp_bounds`. They are scanned in 1 C
+    steps to bracket the last crossing, then every bracket is bisected at once.
+    """
+    solution = np.full(len(press_altitude), np.nan)
+
+    low, high = assumed_temp_bounds(press_altitude, oat, derate_tables)
+    valid = low <= high
+    if not valid.any():
+        return solution
+
+    press_altitude, oat, target_n1, bleeds = (
+        values[valid, None] for values in (press_altitude, oat, target_n1, bleeds))
+    low, high = low[valid, None], high[valid, None]
+
+    # bracket the highest temperature that still reaches the target
+    steps = np.arange(int(np.ceil((high - low).max())) + 1)
+    temps = np.minimum(low + steps, high)
+    reaches = net_n1(temps, press_altitude, oat, bleeds, derate_tables) >= target_n1
+    last = temps.shape[1] - 1 - np.argmax(reaches[:, ::-1], axis=1)
+    rows = np.arange(len(temps))
+    lower = temps[rows, last]
+    upper = temps[rows, np.minimum(last + 1, temps.shape[1] - 1)]
+
+    for _ in range(iterations):
+        middle = (lower + upper) / 2
+        middle_reaches = net_n1(middle, press_altitude[:, 0], oat[:, 0], bleeds[:, 0], derate_tables) >= target_n1[:, 0]
+        lower = np.where(middle_reaches, middle, lower)
+        upper = np.where(middle_reaches, upper, middle)
+
+    solution[valid] = np.where(reaches[:, 0], lower, np.nan)
+    return solution
+
+@app.post('/takeoff/assumed-temp')
+def get_assumed_temp(assumed_temp_request: AssumedTempRequest):
+    tables = table_registry.tables
+    derate = np.array([d.value for d in assumed_temp_request.derate])
+    press_altitude = np.array(assumed_temp_request.press_altitude, dtype=float)
+    oat = np.array(assumed_temp_request.oat, dtype=float)
+    target_n1 = np.array(assumed_temp_request.target_n1, dtype=float)
+    bleeds = np.array(assumed_temp_request.bleeds, dtype=bool)
+
+    assumed_temp = np.full(len(derate), np.nan)
+    n1 = np.full(len(derate), np.nan)
+    for takeoff_derate in np.unique(derate):
+        rows = derate == takeoff_derate
+        derate_tables = tables.derates[derates[takeoff_derate]]
+        # whole degrees, rounded down so the N1 never drops below the target. Rounding
+        # down below a fractional minimum assumed temperature leaves no legal whole degree
+        solution = np.floor(solve_assumed_temp(
+            press_altitude[rows], oat[rows], target_n1[rows], bleeds[rows], derate_tables))
+        low, _high = assumed_temp_bounds(press_altitude[rows], oat[rows], derate_tables)
+        solution[solution < low] = np.nan
+        assumed_temp[rows] = solution
+        n1[rows] = find_n1_batch(assumed_temp[rows], press_altitude[rows], oat[rows], bleeds[rows], derate_tables)
+
+    unsolved = np.isnan(assumed_temp)
     return {
         "success": True,
-        "message": "Success",
-        "n1": round(float(n1) - n1_red, 1) if takeoff_request.bleeds else round(float(n1) - n1_red, 1) + 1
+        "message": "Success" if not unsolved.any() else f"{int(unsolved.sum())} runways cannot reach the target N1 with an assumed temperature",
+        "assumed_temp": [None if missing else int(value) for value, missing in zip(assumed_temp.tolist(), unsolved.tolist())],
+        "n1": [None if missing else value for value, missing in zip(n1.tolist(), unsolved.tolist())]
     }
 
 @app.post('/takeoff/trim')
@@ -148,193 +469,413 @@ def get_trim(trim_request: TrimCalculationRequest):
             "success": False,
             "message": "Unsupported derate"
         }
-    stab_trim_database = pd.read_csv(f"Stab Trim {derates[trim_request.derate]} F1+5.csv")
-    stab_trim_database.columns = ['Weight(kg)', 'CG(%MAC)', 'Trim']
+    tables = table_registry.tables
+    key = (tables.generation, cache_key(trim_request))
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    derate_tables = tables.derates[derates[trim_request.derate]]
+
+    with metrics.stage_seconds.time('interpolation'):
+        trim = stab_trim_setting(trim_request.weight, trim_request.cg, derate_tables)
+
+    response = {
+        "success": True,
+        "message": "Success",
+        "trim": trim
+    }
+    response_cache.put(key, response)
+    return response
+
+# rows a single sweep may ask for, they are streamed so this only bounds the run time
+MAX_SWEEP_ROWS = int(os.environ.get('TAKEOFF_MAX_SWEEP_ROWS', 50_000_000))
+
+@app.post('/takeoff/sweep')
+def get_sweep(sweep_request: TakeoffSweepRequest):
+    sweep = Sweep(sweep_request.table.value, sweep_request.axes())
+    if len(sweep) == 0:
+        return {
+            "success": False,
+            "message": "Every axis needs at least one value"
+        }
+    if len(sweep) > MAX_SWEEP_ROWS:
+        return {
+            "success": False,
+            "message": f"The sweep has {len(sweep)} points, at most {MAX_SWEEP_ROWS} are allowed"
+        }
+    if sweep_request.format == SweepFormat.arrow and not arrow_available():
+        return {
+            "success": False,
+            "message": "Arrow output needs pyarrow installed on the server"
+        }
+    # points outside the tables are empty in CSV and null otherwise
+    return StreamingResponse(
+        encode_sweep(sweep, table_registry.tables, sweep_request.format.value),
+        media_type=SWEEP_FORMATS[sweep_request.format.value],
+        headers={"X-Sweep-Rows": str(len(sweep))},
+    )
+
+@app.post('/takeoff/sheet')
+async def get_takeoff_sheet(sheet_request: TakeoffSheetRequest):
+    conditions = sheet_request.model_dump(include={'press_altitude', 'oat', 'weight', 'cg'})
+    if sheet_request.from_x_plane and None in conditions.values():
+        try:
+            snapshot = await select_telemetry_hub(sheet_request.sim).snapshot()
+        except XPlaneIpNotFound:
+            return {
+                "success": False,
+                "message": "No X-Plane Instance Found"
+            }
+        except XPlaneTimeout:
+            return {
+                "success": False,
+                "message": "X-Plane Timeout"
+            }
+        # values given in the request win over the simulator's
+        for key, value in (('press_altitude', snapshot.press_alt), ('oat', snapshot.tat),
+                           ('weight', snapshot.weight), ('cg', snapshot.cg_mac)):
+            if conditions[key] is None:
+                conditions[key] = value
+
+    if conditions['press_altitude'] is None or conditions['oat'] is None:
+        return {
+            "success": False,
+            "message": "Pressure altitude and OAT are required without X-Plane"
+        }
+
+    with metrics.stage_seconds.time('interpolation'):
+        sheet = takeoff_sheet(conditions['press_altitude'], sheet_request.assumed_temp, conditions['oat'],
+                              sheet_request.bleeds, conditions['weight'], conditions['cg'], table_registry.tables)
+    out_of_range = [derate for derate, n1 in sheet["n1"].items() if n1 is None]
+    return {
+        "success": True,
+        "message": "Success" if not out_of_range else f"{', '.join(out_of_range)} outside the performance tables",
+        "conditions": conditions,
+        **sheet
+    }
 
-    trim = find_trim(trim_request.weight, trim_request.cg, create_interpolator_stab_trim(stab_trim_database))
+@app.get('/cache/stats')
+def get_cache_stats():
+    return {
+        "success": True,
+        "message": "Success",
+        "cache": response_cache.stats()
+    }
 
+@app.get('/metrics', response_class=PlainTextResponse)
+def get_metrics():
+    """Stage timers and counters in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def resolve_sim(sim: str) -> str:
+    """
+    Pool key of the simulator `sim` names ("ip:port", hostname or ip).
+    Raises `XPlaneIpNotFound` for a simulator that is not on the network and in multi worker mode.
+    """
+    if xplane_pool is None:
+        raise XPlaneIpNotFound("Selecting a simulator is not supported with TAKEOFF_MULTI_WORKER.")
+    key = xplane_pool.resolve(sim)
+    if key is None:
+        raise XPlaneIpNotFound(f"No X-Plane instance {sim!r} on the network.")
+    return key
+
+def select_xplane(sim: str | None) -> XPlaneConnection | SharedXPlaneConnection:
+    """Connection to the simulator `sim` names, the default connection without a selector"""
+    if sim is None:
+        return xplane
+    key = resolve_sim(sim)
+    return xplane_pool.connection(key)
+
+def select_telemetry_hub(sim: str | None) -> TelemetryHub:
+    """Telemetry of the simulator `sim` names, the default hub without a selector"""
+    if sim is None:
+        return telemetry_hub
+    key = resolve_sim(sim)
+    hub = telemetry_hubs.get(key)
+    if hub is None:
+        hub = telemetry_hubs[key] = TelemetryHub(xplane_pool.connection(key), table_registry)
+        hub.start()
+    return hub
+
+@app.get('/x-plane/sims')
+def get_sims():
+    """Every X-Plane instance beaconing on the network"""
+    if xplane_pool is None:
+        return {"success": False, "message": "Selecting a simulator is not supported with TAKEOFF_MULTI_WORKER."}
+    now = time.monotonic()
     return {
         "success": True,
         "message": "Success",
-        "trim": round(float(trim) * 4)/4
+        "sims": [
+            {
+                "sim": sim.key,
+                "hostname": sim.beacon.hostname,
+                "ip": sim.beacon.ip,
+                "port": sim.beacon.port,
+                "x_plane_version": sim.beacon.x_plane_version,
+                "role": sim.beacon.role,
+                "last_seen": now - sim.last_seen,
+                "connected": sim.key in xplane_pool.connections and xplane_pool.connections[sim.key].connected,
+            }
+            for sim in xplane_pool.registry.beacons()
+        ]
     }
 
 @app.post('/x-plane/set-derate')
-def set_derate(derate_request: DerateN1Request):
+async def set_derate(derate_request: DerateN1Request, sim: str | None = None):
     try:
-        udp_conn = XPlaneUdp()
-        x_plane_beacon = udp_conn.find_ip()
-        print(
-            f"{x_plane_beacon.ip}:{x_plane_beacon.port}"
-        )
-        udp_conn.write_data_ref("sim/cockpit2/engine/actuators/N1_target_bug", derate_request.derate_N1)
+        (write,) = await write_confirmed(
+            select_xplane(sim), {"sim/cockpit2/engine/actuators/N1_target_bug": derate_request.derate_N1})
 
         return {
             "success": True,
-            "message": "Success"
+            "message": "Success" if write.confirmed else "Written but not confirmed by X-Plane",
+            "confirmed": write.confirmed,
+            "latency": write.latency
+        }
+    except XPlaneIpNotFound:
+        return {
+            "success": False,
+            "message": "No X-Plane Instance Found"
         }
+
+@app.post('/x-plane/set-datarefs')
+async def set_datarefs(write_request: DatarefWriteRequest, sim: str | None = None):
+    """Write every dataref in one paced burst and confirm each one by RREF read-back"""
+    try:
+        writes = await write_confirmed(select_xplane(sim), write_request.values,
+                                       write_request.wait, write_request.retries)
     except XPlaneIpNotFound:
         return {
             "success": False,
             "message": "No X-Plane Instance Found"
         }
+    unconfirmed = [write.dataref for write in writes if not write.confirmed]
+    return {
+        "success": True,
+        "message": "Success" if not unconfirmed else f"{len(unconfirmed)} datarefs not confirmed by X-Plane",
+        "writes": [write.to_message() for write in writes]
+    }
 
 
 @app.get('/x-plane/get-weight')
-def get_weight():
+async def get_weight(sim: str | None = None):
     try:
-        udp_conn = XPlaneUdp()
-        x_plane_beacon = udp_conn.find_ip()
-        print(
-            f"{x_plane_beacon.ip}:{x_plane_beacon.port}"
-        )
-        udp_conn.add_data_ref("sim/flightmodel/weight/m_total")
         return {
             "success": True,
             "message": "Success",
-            "weight": float(udp_conn.get_values()["sim/flightmodel/weight/m_total"])
+            "weight": await select_xplane(sim).get(WEIGHT_DATAREF)
         }
     except XPlaneIpNotFound:
         return {
             "success": False,
             "message": "No X-Plane Instance Found"
         }
+    except XPlaneTimeout:
+        return {
+            "success": False,
+            "message": "X-Plane Timeout"
+        }
 
-# LEMAC: 793 in
 @app.get('/x-plane/get-cg')
-def get_cg():
+async def get_cg(sim: str | None = None):
     try:
-        udp_conn = XPlaneUdp()
-        udp_conn.find_ip()
-        udp_conn.add_data_ref("sim/cockpit2/gauges/indicators/CG_indicator")
-        cg =  float(udp_conn.get_values()["sim/cockpit2/gauges/indicators/CG_indicator"])
-        udp_conn.add_data_ref("sim/cockpit2/gauges/indicators/CG_indicator", freq=0)
+        hub = select_telemetry_hub(sim)
+        await hub.xplane.get(CG_DATAREF)
 
         return {
             "success": True,
             "message": "Success",
-            "cg_mac": cg * 100,
-            "cg_inches": 793 * (cg + 1)
+            "cg_mac": hub.value("cg_mac"),
+            "cg_inches": hub.value("cg_inches")
         }
     except XPlaneIpNotFound:
         return {
             "success": False,
             "message": "No X-Plane Instance Found"
         }
+    except XPlaneTimeout:
+        return {
+            "success": False,
+            "message": "X-Plane Timeout"
+        }
 
-@app.get("/x-plane/get-altitude")
-def get_altitude():
+@app.get('/x-plane/get-trim')
+async def get_xplane_trim(sim: str | None = None):
+    """Stab trim by derate for the simulator's weight and CG"""
     try:
-        udp_conn = XPlaneUdp()
-        udp_conn.find_ip()
-        udp_conn.add_data_ref("sim/flightmodel2/position/pressure_altitude")
+        hub = select_telemetry_hub(sim)
+        await hub.xplane.get(WEIGHT_DATAREF)
+        await hub.xplane.get(CG_DATAREF)
+
         return {
             "success": True,
             "message": "Success",
-            "press_alt": float(udp_conn.get_values()["sim/flightmodel2/position/pressure_altitude"])
+            "trim": hub.value("trim")
         }
     except XPlaneIpNotFound:
         return {
             "success": False,
             "message": "No X-Plane Instance Found"
         }
+    except XPlaneTimeout:
+        return {
+            "success": False,
+            "message": "X-Plane Timeout"
+        }
 
+@app.get("/x-plane/get-altitude")
+async def get_altitude(sim: str | None = None):
+    try:
+        return {
+            "success": True,
+            "message": "Success",
+            "press_alt": await select_xplane(sim).get("sim/flightmodel2/position/pressure_altitude")
+        }
+    except XPlaneIpNotFound:
+        return {
+            "success": False,
+            "message": "No X-Plane Instance Found"
+        }
+    except XPlaneTimeout:
+        return {
+            "success": False,
+            "message": "X-Plane Timeout"
+        }
 
-def get_press_alt(udp_conn: XPlaneUdp) -> float:
-    udp_conn.add_data_ref("sim/weather/barometer_current_inhg")
-    stat_press_inhg = float(udp_conn.get_values()["sim/weather/barometer_current_inhg"])
-    stat_press_hpa = stat_press_inhg * 33.8639
-    pressure_altitude = 145366.45 * (1 - (stat_press_hpa/1013.25)**0.190284)
 
-    return pressure_altitude
+async def get_press_alt(hub: TelemetryHub) -> float:
+    """Pressure altitude of the hub's simulator, recomputed only when the barometer moved"""
+    await hub.xplane.get(BARO_DATAREF)
+    return hub.value("press_alt")
 
 
 
 # sim/weather/barometer_current_inhg
 @app.get("/x-plane/get-press-alt")
-def get_press_altitude():
+async def get_press_altitude(sim: str | None = None):
     try:
-        udp_conn = XPlaneUdp()
-        udp_conn.find_ip()
-        pressure_altitude = get_press_alt(udp_conn)
+        press_alt = await get_press_alt(select_telemetry_hub(sim))
 
 
         return {
             "success": True,
             "message": "Success",
-            "press_alt": pressure_altitude
+            "press_alt": press_alt
         }
     except XPlaneIpNotFound:
         return {
             "success": False,
             "message": "No X-Plane Instance Found"
         }
+    except XPlaneTimeout:
+        return {
+            "success": False,
+            "message": "X-Plane Timeout"
+        }
 
-def create_interpolator_n1_max(df: pd.DataFrame):
-    unique_tat = df['TAT(C)'].unique()
-    unique_pressure_altitude = df['Pressure Altitude(ft)'].unique()
-
-    n1_matrix = df.pivot(
-        index='TAT(C)',
-        columns='Pressure Altitude(ft)',
-        values='N1(%)'
-    ).values
-
-    return RegularGridInterpolator((unique_tat, unique_pressure_altitude), n1_matrix)
-
-def find_max_n1(tat: float, press_alt: float, interp_func: RegularGridInterpolator) -> float:
-    return float(interp_func((tat, press_alt)))
+def push_options(data: dict) -> tuple[float, Deadband]:
+    """Rate and deadband asked for in a subscription, the server defaults for anything left out"""
+    try:
+        rate = float(data.get("rate", push_rate))
+        deadband = Deadband(
+            tat=float(data.get("tat_deadband", push_deadband.tat)),
+            press_alt=float(data.get("press_alt_deadband", push_deadband.press_alt)),
+        )
+    except (TypeError, ValueError) as exc:
+        raise ValueError("rate and deadbands must be numbers") from exc
+    if not 0 < rate <= MAX_PUSH_RATE:
+        raise ValueError(f"rate must be above 0 and at most {MAX_PUSH_RATE} per second")
+    if deadband.tat < 0 or deadband.press_alt < 0:
+        raise ValueError("deadbands cannot be negative")
+    return rate, deadband
+
+async def push_telemetry(websocket: WebSocket, queue: asyncio.Queue, rate: float, deadband: Deadband,
+                         encoder: DeltaEncoder | None = None):
+    """
+    Push snapshots whose TAT or pressure altitude moved beyond `deadband`, at most
+    `rate` times a second. Snapshots arriving while a push waits replace each
+    other in the size 1 queue, only the newest one is sent. A client whose
+    socket stays full for PUSH_SEND_TIMEOUT is disconnected.
+    Snapshots are JSON messages, or binary delta frames with an `encoder`.
+    """
+    interval = 1 / rate
+    sent = None
+    next_push = 0.0
+    while True:
+        snapshot = await queue.get()
+        if not deadband.exceeded(sent, snapshot):
+            metrics.push_frames.inc(label="filtered")
+            continue
+        delay = next_push - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            if not queue.empty():
+                metrics.push_frames.inc(label="coalesced")
+                snapshot = queue.get_nowait()
+                if not deadband.exceeded(sent, snapshot):
+                    continue
+
+        try:
+            with metrics.stage_seconds.time('websocket_send'):
+                send = websocket.send_json(snapshot.to_message()) if encoder is None \
+                    else websocket.send_bytes(encoder.encode(snapshot))
+                await asyncio.wait_for(send, PUSH_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.push_frames.inc(label="slow_client")
+            # 1013: try again later
+            await websocket.close(code=1013)
+            return
+        metrics.push_frames.inc(label="sent")
+        sent = snapshot
+        next_push = time.monotonic() + interval
 
 @app.websocket("/x-plane/max-n1-ws")
 async def max_n1_ws(websocket: WebSocket):
-    await websocket.accept()
-    n1_subscription_status = False
-    max_n1 = pd.read_csv("Max Climb N1%.csv")
-    max_n1.columns = ['TAT(C)', 'Pressure Altitude(ft)', 'N1(%)']
-    while True:
-        
-        if n1_subscription_status:
-            try:
-                udp_conn = XPlaneUdp()
-                udp_conn.find_ip()
-                press_alt = get_press_alt(udp_conn)
-                udp_conn.add_data_ref("sim/cockpit2/temperature/outside_air_temp_deg")
-                temp = float(udp_conn.get_values()["sim/cockpit2/temperature/outside_air_temp_deg"])
-
-                press_alt = min(press_alt, 41000)
-                
-                press_alt = max(press_alt, 0)
-
-                if temp < -40:
-                    temp = -40
-                
-                temp = min(temp,0)
-                
-                max_n1_perc = find_max_n1(temp, press_alt, create_interpolator_n1_max(max_n1))
-
+    # clients offering the binary subprotocol are pushed delta frames, the others JSON
+    binary = SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=SUBPROTOCOL if binary else None)
+    hub = None
+    queue = None
+    sender = None
+    try:
+        while True:
+            data = await websocket.receive_json()
+
+            if data["request"] == "sub_max_n1" and sender is None:
+                try:
+                    rate, deadband = push_options(data)
+                except ValueError as exc:
+                    await websocket.send_json({
+                        "success": False,
+                        "message": str(exc),
+                    })
+                    continue
+                # the simulator is picked in the subscription or the `sim` query parameter
+                try:
+                    hub = select_telemetry_hub(data.get("sim", websocket.query_params.get("sim")))
+                except XPlaneIpNotFound:
+                    await websocket.send_json({
+                        "success": False,
+                        "message": "No X-Plane Instance Found",
+                    })
+                    continue
+                encoder = None
+                if binary:
+                    encoder = DeltaEncoder()
+                    await websocket.send_bytes(schema_frame())
+                queue = hub.subscribe()
+                sender = asyncio.create_task(push_telemetry(websocket, queue, rate, deadband, encoder))
+            # subscribed clients are pushed every change beyond their deadband, a ping is only a keepalive
+            if data["request"] == "ping" and sender is None:
                 await websocket.send_json({
                     "success": True,
-                    "message": "Success",
-                    "max_n1": max_n1_perc
+                    "message": "pong",
                 })
-                print("Sent")
-            except XPlaneIpNotFound:
-                await websocket.send_json({
-                    "success": "false",
-                    "message": "No X-Plane Instance Found"
-                })
-        
-        data = await websocket.receive_json()
-
-        if data["request"] == "sub_max_n1":
-            n1_subscription_status = True
-        if data["request"] == "ping":
-            await websocket.send({
-                "success": True,
-                "message": "pong",
-            })    
-
-
-
-
-
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sender is not None:
+            sender.cancel()
+        if queue is not None:
+            hub.unsubscribe(queue)
@@ -0,0 +1,143 @@
+"""
+Lightweight instrumentation: counters and per-stage timers, rendered in the
+Prometheus text exposition format by `/metrics`.
+Recording a sample is a `perf_counter` pair and a short locked update, cheap
+enough for the interpolation hot path.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+# histogram bucket upper bounds in seconds, from single lookups to X-Plane discovery
+STAGE_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0)
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label"""
+
+    def __init__(self, name: str, help: str, label: str | None = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: dict[str | None, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, label: str | None = None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label: str | None = None) -> float:
+        return self._values.get(label, 0)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label, value in sorted(self._values.items(), key=lambda item: item[0] or ''):
+            yield f"{self.name}{_labels(self.label, label)} {_number(value)}"
+
+
+class StageTimer:
+    """Histogram of durations per stage"""
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # stage: [count per bucket (last one is +Inf), total count, sum]
+        self._stages: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            entry[0][bucket] += 1
+            entry[1] += 1
+            entry[2] += seconds
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str) -> Callable:
+        """Decorator timing every call of a function"""
+        def decorator(func: Callable) -> Callable:
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            wrapper.__wrapped__ = func
+            return wrapper
+
+        return decorator
+
+    def count(self, stage: str) -> int:
+        entry = self._stages.get(stage)
+        return entry[1] if entry is not None else 0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            stages = {stage: (list(counts), count, total) for stage, (counts, count, total) in self._stages.items()}
+        for stage, (counts, count, total) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                yield f'{self.name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}'
+            yield f'{self.name}_sum{{stage="{stage}"}} {_number(total)}'
+            yield f'{self.name}_count{{stage="{stage}"}} {count}'
+
+
+def _number(value: float) -> str:
+    """Sample value without losing digits, whole numbers without exponent"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(name: str | None, value: str | None) -> str:
+    if name is None or value is None:
+        return ""
+    return f'{{{name}="{value}"}}'
+
+
+stage_seconds = StageTimer("takeoff_stage_seconds", "Time spent per processing stage")
+xplane_timeouts = Counter("takeoff_xplane_timeouts_total", "X-Plane requests or streams that timed out", "operation")
+unknown_packets = Counter("takeoff_unknown_packets_total", "Packets with an unexpected header", "socket")
+rref_packets = Counter("takeoff_rref_packets_total", "RREF packets received")
+push_frames = Counter("takeoff_push_frames_total", "Max N1 websocket snapshots by outcome", "outcome")
+derived_computations = Counter("takeoff_derived_computations_total",
+                               "Derived values recomputed after their inputs changed", "node")
+dref_writes = Counter("takeoff_dref_writes_total", "Acknowledged dataref writes by outcome", "outcome")
+
+# extra metrics computed at scrape time, each returns exposition lines
+_collectors: list[Callable[[], Iterator[str]]] = []
+
+
+def add_collector(collector: Callable[[], Iterator[str]]):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in (stage_seconds, xplane_timeouts, unknown_packets, rref_packets, push_frames, derived_computations,
+                   dref_writes):
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
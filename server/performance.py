@@ -0,0 +1,205 @@
+"""
+Calculation core shared by the API and takeoff-console.py.
+Importing it costs a few milliseconds: no web framework, pandas or scipy, and
+numpy is only imported once an interpolator is called with arrays.
+"""
+
+import itertools
+import os
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Mapping, Sequence
+
+from table_pack import PACK_FILE, read_pack_lists
+
+if TYPE_CHECKING:
+    from tables import Interpolator, PerformanceTables
+
+
+PACK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), PACK_FILE)
+
+derates = {
+    'TO': '26K',
+    'TO-1': '24K',
+    'TO-2': '22K'
+}
+
+
+class GridTable:
+    """
+    Linear interpolation over a rectilinear grid, called like scipy's
+    `RegularGridInterpolator`. Every corner weight is multiplied out before it
+    scales the corner value and the corners are summed in scipy's hypercube
+    order, the operation order of `RegularGridInterpolator._evaluate_linear`,
+    so results match it bit for bit and round the same way.
+    Single points are interpolated in pure Python, arrays of points with numpy.
+    Points outside the grid raise `ValueError`.
+    """
+
+    def __init__(self, grid: Sequence[Sequence[float]], values):
+        self.grid = tuple(grid)
+        self.values = values
+        self.ndim = len(self.grid)
+        self._axes = [[float(x) for x in axis] for axis in self.grid]
+        self._rows = values.tolist() if hasattr(values, 'tolist') else values
+        self._arrays = None
+
+    def __call__(self, xi):
+        if isinstance(xi, tuple) and len(xi) == self.ndim \
+                and all(isinstance(x, (int, float)) or getattr(x, 'ndim', None) == 0 for x in xi):
+            return self.find(*(float(x) for x in xi))
+        return self.find_many(xi)
+
+    def _cell(self, dim: int, x: float) -> tuple[int, float]:
+        axis = self._axes[dim]
+        if not axis[0] <= x <= axis[-1]:
+            raise ValueError(f"One of the requested xi is out of bounds in dimension {dim}")
+        i = min(max(bisect_right(axis, x) - 1, 0), len(axis) - 2)
+        return i, (x - axis[i]) / (axis[i + 1] - axis[i])
+
+    def find(self, *point: float) -> float:
+        """Interpolation of a single point"""
+        if self.ndim == 1:
+            i, t = self._cell(0, point[0])
+            return 0.0 + self._rows[i] * (1 - t) + self._rows[i + 1] * t
+
+        i, t = self._cell(0, point[0])
+        j, u = self._cell(1, point[1])
+        row, next_row = self._rows[i], self._rows[i + 1]
+        return 0.0 + row[j] * ((1 - t) * (1 - u)) + row[j + 1] * ((1 - t) * u) \
+            + next_row[j] * (t * (1 - u)) + next_row[j + 1] * (t * u)
+
+    def find_many(self, xi):
+        """Interpolation of an array of points, the last axis holding the coordinates"""
+        import numpy as np
+
+        if self._arrays is None:
+            self._arrays = ([np.asarray(axis, dtype=float) for axis in self.grid],
+                            np.asarray(self.values, dtype=float))
+        axes, values = self._arrays
+
+        if isinstance(xi, tuple):
+            points = np.stack(np.broadcast_arrays(*xi), axis=-1).astype(float)
+        else:
+            points = np.asarray(xi, dtype=float)
+            if self.ndim == 1 and points.shape[-1:] != (1,):
+                points = points[..., None]
+        shape = points.shape[:-1]
+        points = points.reshape(-1, self.ndim)
+
+        indices, distances = [], []
+        for dim, axis in enumerate(axes):
+            x = points[:, dim]
+            if not np.all((axis[0] <= x) & (x <= axis[-1])):
+                raise ValueError(f"One of the requested xi is out of bounds in dimension {dim}")
+            i = np.clip(np.searchsorted(axis, x, side='right') - 1, 0, len(axis) - 2)
+            indices.append(i)
+            distances.append((x - axis[i]) / (axis[i + 1] - axis[i]))
+
+        if self.ndim == 2:
+            (i, j), (t, u) = indices, distances
+            result = 0.0 + values[i, j] * ((1 - t) * (1 - u)) + values[i, j + 1] * ((1 - t) * u) \
+                + values[i + 1, j] * (t * (1 - u)) + values[i + 1, j + 1] * (t * u)
+            return result.reshape(shape)
+
+        result = np.zeros(len(points))
+        for corner in itertools.product((0, 1), repeat=self.ndim):
+            weight = np.ones(len(points))
+            for upper, distance in zip(corner, distances):
+                weight = weight * (distance if upper else 1 - distance)
+            result = result + values[tuple(i + upper for i, upper in zip(indices, corner))] * weight
+        return result.reshape(shape)
+
+
+@dataclass(frozen=True)
+class DerateTables:
+    """Interpolators for one thrust rating"""
+    n1: 'Interpolator'
+    min_assumed_temp: GridTable
+    n1_reduction: 'Interpolator'
+    stab_trim: 'Interpolator | None'
+
+
+def derate_tables_from_grids(grids: Mapping[str, tuple], thrust: str,
+                             wrap: Callable[[GridTable], 'Interpolator'] = lambda table: table) -> DerateTables:
+    """`DerateTables` of `thrust` from the grids of a compiled table file"""
+    def table(name: str) -> GridTable:
+        axes, values = grids[name]
+        return GridTable(axes, values)
+
+    stab_trim = f'stab_trim-{thrust}'
+    return DerateTables(
+        n1=wrap(table(f'n1-{thrust}')),
+        min_assumed_temp=table(f'min_assumed_temp-{thrust}'),
+        n1_reduction=wrap(table(f'n1_reduction-{thrust}')),
+        stab_trim=wrap(table(stab_trim)) if stab_trim in grids else None,
+    )
+
+
+def read_derate_tables(thrust: str, path: str = PACK_PATH) -> DerateTables:
+    """Tables of one thrust rating straight from the compiled file, without numpy"""
+    return derate_tables_from_grids(read_pack_lists(path), thrust)
+
+
+def find_n1(pressure_altitude: float, assumed_temp: int, interp_func: 'Interpolator'):
+    """Alias function to find N1 using interpolation function"""
+    return interp_func((pressure_altitude, assumed_temp))
+
+
+def find_trim(weight: float, cg: float, interp_func: 'Interpolator'):
+    return interp_func((weight, cg))
+
+
+def find_n1_reduction(assumed_temp_minus_oat: int, oat: int, interp_func: 'Interpolator'):
+    return interp_func((assumed_temp_minus_oat, oat))
+
+
+def derate_n1(press_altitude: float, assumed_temp: int, oat: int, bleeds: bool, derate_tables: DerateTables) -> float:
+    """Assumed temperature N1 net of the OAT reduction, one more with the bleeds off"""
+    n1 = float(find_n1(press_altitude, assumed_temp, derate_tables.n1))
+    n1_red = float(find_n1_reduction(assumed_temp - oat, oat, derate_tables.n1_reduction))
+    return round(n1 - n1_red, 1) if bleeds else round(n1 - n1_red, 1) + 1
+
+
+def stab_trim_setting(weight: float, cg: float, derate_tables: DerateTables) -> float:
+    """Stab trim rounded to the quarter unit"""
+    return round(float(find_trim(weight, cg, derate_tables.stab_trim)) * 4)/4
+
+
+def vref_speeds(weight: float, vref_table: GridTable) -> dict[str, int]:
+    """VREF in knots for every landing flap setting of the table, keyed by flaps"""
+    return {
+        str(int(flaps)): round(float(vref_table((weight, flaps))))
+        for flaps in vref_table.grid[1]
+    }
+
+
+def takeoff_sheet(press_altitude: float, assumed_temp: int, oat: float, bleeds: bool,
+                  weight: float | None, cg: float | None, tables: 'PerformanceTables') -> dict:
+    """
+    N1 for every derate, stab trim for every derate with a trim table and VREF by flaps.
+    Values outside the tables, or missing weight/CG, come back as None.
+    """
+    n1: dict[str, float | None] = {}
+    trim: dict[str, float | None] = {}
+    for derate, thrust in derates.items():
+        derate_tables = tables.derates[thrust]
+        try:
+            n1[derate] = derate_n1(press_altitude, assumed_temp, oat, bleeds, derate_tables)
+        except ValueError:
+            n1[derate] = None
+        if derate_tables.stab_trim is not None:
+            try:
+                trim[derate] = stab_trim_setting(weight, cg, derate_tables) \
+                    if weight is not None and cg is not None else None
+            except ValueError:
+                trim[derate] = None
+
+    vref: dict[str, int] | None = None
+    if weight is not None:
+        try:
+            vref = vref_speeds(weight, tables.vref)
+        except ValueError:
+            pass
+
+    return {"n1": n1, "trim": trim, "vref": vref}
@@ -0,0 +1,84 @@
+"""
+Bounded LRU cache for calculation responses.
+Requests are all small integer/enum/bool models, so the same handful of inputs
+keeps coming back. Entries are keyed on the normalised request model and
+dropped when the performance tables reload.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from pydantic import BaseModel
+
+
+def cache_key(request: BaseModel) -> Hashable:
+    """Normalised, hashable key for a request model"""
+    return (type(request).__name__,) + tuple(
+        value.value if hasattr(value, 'value') else value
+        for value in request.model_dump().values()
+    )
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional time to live per entry"""
+
+    def __init__(self, maxsize: int = 4096, ttl: float | None = None):
+        self.maxsize = maxsize
+        # seconds an entry stays valid, None keeps entries until evicted
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Cached value for `key`, None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, counted as an invalidation"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,465 @@
+"""
+X-Plane connection shared between the workers of a multi-process deployment.
+The worker holding an exclusive lock file owns the only `XPlaneConnection` and
+publishes every update over a Unix socket, the other workers mirror the values
+and forward their subscriptions and dataref writes to it. When the owner exits
+its lock is released and one of the remaining workers takes over.
+
+Frames are newline delimited JSON. A follower gets the whole state when it
+connects and after it fell behind, and then only the datarefs each packet
+updated: the values that changed, and the update time once for every
+dataref that packet refreshed. Unix only (fcntl and Unix sockets).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Callable, Mapping
+
+from x_plane_udp import XPlaneBeaconData, XPlaneIpNotFound, XPlaneTimeout
+from xplane_connection import XPlaneConnection
+
+
+logger = logging.getLogger(__name__)
+
+
+# longest frame a worker reads, a full state frame of a few thousand datarefs fits easily
+IPC_READ_LIMIT = 16 * 1024 * 1024
+# longest pause between two attempts to own or follow after unexpected errors
+MAX_RETRY_INTERVAL = 30.0
+
+
+def default_ipc_path() -> str:
+    return os.path.join(tempfile.gettempdir(), f"takeoff-calc-{os.getuid()}.sock")
+
+
+class SharedXPlaneConnection:
+    """
+    Drop-in replacement for `XPlaneConnection` in every worker.
+    Owner and followers look the same to endpoints and the telemetry hub.
+    """
+
+    def __init__(self, path: str | None = None, freq: int = 5, retry_interval: float = 1.0,
+                 max_buffered: int = 64 * 1024):
+        # Unix socket the owner listens on, the lock file sits next to it
+        self.path = path or default_ipc_path()
+        self.freq = freq
+        self.retry_interval = retry_interval
+        # bytes queued for a follower before its frames are skipped
+        self.max_buffered = max_buffered
+        self._lock_file = None
+        self._local: XPlaneConnection | None = None
+        self._followers: set[asyncio.StreamWriter] = set()
+        # followers that skipped a frame and are sent the whole state next
+        self._stale_followers: set[asyncio.StreamWriter] = set()
+        # values and update times of the last frame published to the followers
+        self._published: dict[str, float] = {}
+        self._published_updated: dict[str, float | None] = {}
+        self._published_link: tuple = (False, None)
+        self._owner: asyncio.StreamWriter | None = None
+        # mirrored state of the owner's connection
+        self._connected = False
+        self._beacon: XPlaneBeaconData | None = None
+        self._values: dict[str, float] = {}
+        self._updated: dict[str, float] = {}
+        self._requests: dict[int, asyncio.Future] = {}
+        self._forwarding: set[asyncio.Task] = set()
+        self._next_request = 0
+        self._subscriptions: set[str] = set()
+        # key = dataref, value = number of holders in this worker
+        self._holds: dict[str, int] = {}
+        # datarefs each follower holds, released for it when it goes away
+        self._follower_holds: dict[asyncio.StreamWriter, set[str]] = {}
+        self._listeners: list[Callable[["SharedXPlaneConnection"], None]] = []
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_owner(self) -> bool:
+        return self._local is not None
+
+    @property
+    def connected(self) -> bool:
+        return self._local.connected if self._local is not None else self._connected
+
+    @property
+    def beacon(self) -> XPlaneBeaconData | None:
+        return self._local.beacon if self._local is not None else self._beacon
+
+    @property
+    def values(self) -> Mapping[str, float]:
+        return self._local.values if self._local is not None else self._values
+
+    def updated_at(self, dataref: str) -> float | None:
+        return self._local.updated_at(dataref) if self._local is not None else self._updated.get(dataref)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._changed = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(), name="shared-x-plane-connection")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._release_lock()
+
+    def _try_lock(self) -> bool:
+        import fcntl
+
+        lock_file = open(f"{self.path}.lock", 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _run(self):
+        retry_interval = self.retry_interval
+        while True:
+            try:
+                if self._try_lock():
+                    try:
+                        await self._own()
+                    finally:
+                        # let another worker take over whatever ended the ownership
+                        self._release_lock()
+                await self._follow()
+                retry_interval = self.retry_interval
+            except (ConnectionError, FileNotFoundError):
+                # the owner is starting up or gone, try to take over
+                await asyncio.sleep(self.retry_interval)
+            except Exception:
+                logger.exception("Shared X-Plane connection failed, retrying in %.1f s", retry_interval)
+                await asyncio.sleep(retry_interval)
+                retry_interval = min(retry_interval * 2, MAX_RETRY_INTERVAL)
+
+    # owner
+
+    async def _own(self):
+        logger.info("Owning the X-Plane connection, publishing on %s", self.path)
+        local = XPlaneConnection(self.freq, self.retry_interval)
+        # the other workers send their subscriptions and holds again once they follow
+        local.subscribe(*self._subscriptions)
+        local.hold(*self._holds)
+        local.add_listener(self._local_changed)
+        async with self._changed:
+            self._local = local
+            self._changed.notify_all()
+        if os.path.exists(self.path):
+            # left behind by a previous owner, we hold the lock so nobody else uses it
+            os.unlink(self.path)
+        self._published = {}
+        self._published_updated = {}
+        self._published_link = (False, None)
+        server = await asyncio.start_unix_server(self._serve_follower, self.path, limit=IPC_READ_LIMIT)
+        local.start()
+        try:
+            await asyncio.Future()
+        finally:
+            server.close()
+            for writer in self._followers:
+                writer.close()
+            self._stale_followers.clear()
+            await local.stop()
+            self._local = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def _link(self) -> tuple:
+        local = self._local
+        assert local is not None
+        return local.connected, asdict(local.beacon) if local.beacon is not None else None
+
+    def _state_frame(self) -> bytes:
+        local = self._local
+        assert local is not None
+        values = dict(local.values)
+        connected, beacon = self._link()
+        return (json.dumps({
+            "type": "values",
+            "connected": connected,
+            "beacon": beacon,
+            "values": values,
+            "updated": {dataref: local.updated_at(dataref) for dataref in values},
+        }) + "\n").encode()
+
+    def _delta_frame(self) -> bytes | None:
+        """Datarefs updated or gone since the last published frame, None when nothing changed"""
+        local = self._local
+        assert local is not None
+        values = dict(local.values)
+        changed = {dataref: value for dataref, value in values.items()
+                   if dataref not in self._published or self._published[dataref] != value}
+        # one packet refreshes every streamed dataref at once, group them by time
+        refreshed: dict[float | None, list[str]] = {}
+        updated = {}
+        for dataref in values:
+            at = updated[dataref] = local.updated_at(dataref)
+            if at != self._published_updated.get(dataref):
+                refreshed.setdefault(at, []).append(dataref)
+        removed = [dataref for dataref in self._published if dataref not in values]
+        link = self._link()
+        self._published = values
+        self._published_updated = updated
+        if not refreshed and not removed and link == self._published_link:
+            return None
+        frame = {"type": "delta", "values": changed, "updated": list(refreshed.items()), "removed": removed}
+        if link != self._published_link:
+            frame["connected"], frame["beacon"] = link
+            self._published_link = link
+        return (json.dumps(frame) + "\n").encode()
+
+    def _local_changed(self, _local: XPlaneConnection):
+        self._notify_listeners()
+        if not self._followers:
+            return
+        delta = self._delta_frame()
+        state = None
+        for writer in self._followers:
+            # a follower that cannot keep up skips frames and catches up with the whole state
+            if writer.transport.get_write_buffer_size() > self.max_buffered:
+                self._stale_followers.add(writer)
+            elif writer in self._stale_followers:
+                state = state or self._state_frame()
+                writer.write(state)
+                self._stale_followers.discard(writer)
+            elif delta is not None:
+                writer.write(delta)
+
+    async def _serve_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._followers.add(writer)
+        holds = self._follower_holds[writer] = set()
+        writer.write(self._state_frame())
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["type"] == "subscribe":
+                    self.subscribe(*message["datarefs"])
+                elif message["type"] == "resubscribe":
+                    self.resubscribe(*message["datarefs"])
+                elif message["type"] == "hold":
+                    new = [dataref for dataref in message["datarefs"] if dataref not in holds]
+                    holds.update(new)
+                    self._hold_local(*new)
+                elif message["type"] == "release":
+                    gone = [dataref for dataref in message["datarefs"] if dataref in holds]
+                    holds.difference_update(gone)
+                    self._release_local(*gone)
+                elif message["type"] == "write":
+                    task = asyncio.create_task(self._forward_write(writer, message))
+                    self._forwarding.add(task)
+                    task.add_done_callback(self._forwarding.discard)
+        except (ConnectionError, ValueError):
+            # ValueError covers malformed JSON and lines over IPC_READ_LIMIT
+            pass
+        finally:
+            self._followers.discard(writer)
+            self._stale_followers.discard(writer)
+            del self._follower_holds[writer]
+            self._release_local(*holds)
+            writer.close()
+
+    async def _forward_write(self, writer: asyncio.StreamWriter, message: dict):
+        error = None
+        try:
+            await self.write_data_refs(message["values"])
+        except XPlaneIpNotFound:
+            error = "not_found"
+        writer.write((json.dumps({"type": "result", "id": message["id"], "error": error}) + "\n").encode())
+
+    # follower
+
+    async def _follow(self):
+        reader, writer = await asyncio.open_unix_connection(self.path, limit=IPC_READ_LIMIT)
+        logger.info("Following the X-Plane connection published on %s", self.path)
+        self._owner = writer
+        if self._subscriptions:
+            self._send_owner({"type": "subscribe", "datarefs": sorted(self._subscriptions)})
+        if self._holds:
+            self._send_owner({"type": "hold", "datarefs": sorted(self._holds)})
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["type"] in ("values", "delta"):
+                    await self._mirror(message)
+                elif message["type"] == "result":
+                    future = self._requests.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        future.set_result(message["error"])
+        finally:
+            self._owner = None
+            writer.close()
+            # writes still in flight are lost with the owner
+            for future in self._requests.values():
+                if not future.done():
+                    future.set_result("not_found")
+            self._requests.clear()
+            await self._mirror({"connected": False, "beacon": None, "values": {}, "updated": {}})
+
+    async def _mirror(self, message: dict):
+        async with self._changed:
+            if "connected" in message:
+                # deltas only carry the connection when it changed
+                self._connected = message["connected"]
+                self._beacon = XPlaneBeaconData(**message["beacon"]) if message["beacon"] is not None else None
+            if message.get("type") == "delta":
+                self._values.update(message["values"])
+                for at, datarefs in message["updated"]:
+                    self._updated.update(dict.fromkeys(datarefs, at))
+                for dataref in message["removed"]:
+                    self._values.pop(dataref, None)
+                    self._updated.pop(dataref, None)
+            else:
+                self._values = message["values"]
+                self._updated = message["updated"]
+            self._changed.notify_all()
+        self._notify_listeners()
+
+    def _send_owner(self, message: dict):
+        if self._owner is not None:
+            self._owner.write((json.dumps(message) + "\n").encode())
+
+    # XPlaneConnection interface
+
+    def add_listener(self, callback: Callable[["SharedXPlaneConnection"], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[["SharedXPlaneConnection"], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            callback(self)
+
+    def subscribe(self, *datarefs: str):
+        new = [dataref for dataref in datarefs if dataref not in self._subscriptions]
+        self._subscriptions.update(new)
+        if not new:
+            return
+        if self._local is not None:
+            self._local.subscribe(*new)
+        else:
+            self._send_owner({"type": "subscribe", "datarefs": new})
+
+    def hold(self, *datarefs: str):
+        """Stream `datarefs` until every hold on them is released, in any worker"""
+        new = []
+        for dataref in datarefs:
+            self._holds[dataref] = self._holds.get(dataref, 0) + 1
+            if self._holds[dataref] == 1:
+                new.append(dataref)
+        if not new:
+            return
+        if self._local is not None:
+            self._hold_local(*new)
+        else:
+            self._send_owner({"type": "hold", "datarefs": new})
+
+    def release(self, *datarefs: str):
+        gone = []
+        for dataref in datarefs:
+            if dataref not in self._holds:
+                continue
+            self._holds[dataref] -= 1
+            if not self._holds[dataref]:
+                del self._holds[dataref]
+                gone.append(dataref)
+        if not gone:
+            return
+        if self._local is not None:
+            self._release_local(*gone)
+        else:
+            self._send_owner({"type": "release", "datarefs": gone})
+
+    def _hold_local(self, *datarefs: str):
+        # the owner's connection counts one hold per worker holding the dataref
+        if self._local is not None and datarefs:
+            self._local.hold(*datarefs)
+
+    def _release_local(self, *datarefs: str):
+        if self._local is not None and datarefs:
+            self._local.release(*datarefs)
+
+    def resubscribe(self, *datarefs: str):
+        if self._local is not None:
+            self._local.resubscribe(*datarefs)
+        else:
+            self._send_owner({"type": "resubscribe", "datarefs": list(datarefs)})
+
+    async def wait_connected(self, timeout: float = 3.0):
+        """Wait until the owner has discovered X-Plane"""
+        if self._local is not None:
+            return await self._local.wait_connected(timeout)
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.connected or self._local is not None), timeout)
+            except asyncio.TimeoutError as exc:
+                raise XPlaneIpNotFound() from exc
+        if self._local is not None:
+            return await self._local.wait_connected(timeout)
+
+    async def get(self, dataref: str, timeout: float = 3.0) -> float:
+        if self._local is not None:
+            return await self._local.get(dataref, timeout)
+        # recorded even when another worker's subscription already streams it
+        self.subscribe(dataref)
+        value = self._values.get(dataref)
+        if value is not None:
+            return value
+
+        deadline = time.monotonic() + timeout
+        await self.wait_connected(timeout)
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: dataref in self.values or not self.connected),
+                    max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError as exc:
+                raise XPlaneTimeout() from exc
+            if dataref not in self.values:
+                raise XPlaneIpNotFound()
+            return self.values[dataref]
+
+    async def write_data_ref(self, dataref: str, value: float | int | bool, timeout: float = 3.0):
+        await self.write_data_refs({dataref: value}, timeout)
+
+    async def write_data_refs(self, values: Mapping[str, float | int | bool], timeout: float = 3.0):
+        if self._local is not None:
+            return await self._local.write_data_refs(values, timeout)
+        if self._owner is None:
+            raise XPlaneIpNotFound()
+        self._next_request += 1
+        request_id = self._next_request
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = future
+        self._send_owner({"type": "write", "id": request_id, "values": dict(values)})
+        try:
+            error = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as exc:
+            raise XPlaneIpNotFound() from exc
+        finally:
+            self._requests.pop(request_id, None)
+        if error is not None:
+            raise XPlaneIpNotFound()
@@ -0,0 +1,233 @@
+"""
+Compiled, memory-mapped form of the performance tables.
+Every table is stored as its sorted axes and value grid in one versioned file
+with a CRC32 over its contents. Loading it is a `numpy.memmap` and a handful of
+array views, no CSV parsing and no pandas, and every worker mapping the same
+file shares its pages. `read_pack_lists` reads it without numpy for the console.
+The CSV file names live here too, so `pack_is_current` does not import numpy.
+
+    python table_pack.py                 compile the CSVs next to this file
+    python table_pack.py --check         verify the compiled file, exit 1 if stale or corrupt
+
+Layout: header `<8sIII` (magic, format version, index length, CRC32 of
+everything after the header), a JSON index, then the 64 byte aligned arrays.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Any, Mapping, Sequence
+
+
+TABLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# engine thrust rating for every derate we ship tables for
+DERATE_THRUSTS = ('26K', '24K', '22K')
+# stab trim tables only exist for these ratings
+TRIM_THRUSTS = ('26K', '24K')
+
+MAX_CLIMB_N1_FILE = 'Max Climb N1%.csv'
+VREF_FILE = 'VREF.csv'
+
+PACK_FILE = 'tables.bin'
+PACK_MAGIC = b'TKOFFTBL'
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct('<8sIII')
+
+AXIS_DTYPE = '<f8'
+# float32 would move exact table entries like 98.55 off their decimal value and
+# flip the rounding of about 7% of derate N1 results, the whole file is only a few kB
+VALUE_DTYPE = '<f8'
+ALIGNMENT = 64
+
+
+class TablePackError(ValueError):
+    """The compiled table file is missing, corrupt or from another format version"""
+
+
+# name: (axes, values), numpy arrays or lists
+Grid = tuple[Sequence[Any], Any]
+
+
+def table_files(thrust: str) -> dict[str, str]:
+    """File names of every table for one thrust rating"""
+    files = {
+        'n1': f'data-{thrust}.csv',
+        'n1_reduction': f'data-reduction-{thrust}.csv',
+    }
+    if thrust in TRIM_THRUSTS:
+        files['stab_trim'] = f'Stab Trim {thrust} F1+5.csv'
+    return files
+
+
+def all_table_files() -> list[str]:
+    files = [MAX_CLIMB_N1_FILE, VREF_FILE]
+    for thrust in DERATE_THRUSTS:
+        files.extend(table_files(thrust).values())
+    return files
+
+
+def pack_is_current(directory: str = TABLE_DIR, path: str | None = None) -> bool:
+    """True if the compiled file exists and is newer than every CSV"""
+    path = path or os.path.join(directory, PACK_FILE)
+    if not os.path.exists(path):
+        return False
+    csv_mtimes = [
+        os.stat(os.path.join(directory, name)).st_mtime
+        for name in all_table_files() if os.path.exists(os.path.join(directory, name))
+    ]
+    return os.stat(path).st_mtime >= max(csv_mtimes, default=0.0)
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_pack(path: str, grids: Mapping[str, Grid]):
+    """Write `grids` to `path`, atomically replacing any previous file"""
+    import numpy as np
+
+    index: dict[str, dict] = {}
+    chunks: list[tuple[int, bytes]] = []
+    offset = 0
+    for name, (axes, values) in grids.items():
+        entry: dict = {"axes": []}
+        for axis in axes:
+            data = np.ascontiguousarray(axis, dtype=AXIS_DTYPE).tobytes()
+            entry["axes"].append([offset, len(axis)])
+            chunks.append((offset, data))
+            offset = _align(offset + len(data))
+        data = np.ascontiguousarray(values, dtype=VALUE_DTYPE).tobytes()
+        entry["values"] = [offset, list(np.shape(values))]
+        chunks.append((offset, data))
+        offset = _align(offset + len(data))
+        index[name] = entry
+
+    index_bytes = json.dumps({"tables": index}, separators=(',', ':')).encode()
+    # arrays start on an aligned offset from the start of the file
+    data_start = _align(PACK_HEADER.size + len(index_bytes))
+    body = bytearray(data_start - PACK_HEADER.size + offset)
+    body[:len(index_bytes)] = index_bytes
+    for chunk_offset, data in chunks:
+        start = data_start - PACK_HEADER.size + chunk_offset
+        body[start:start + len(data)] = data
+    header = PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index_bytes), zlib.crc32(body))
+
+    # unique per process, several workers may compile at once
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(header)
+        file.write(body)
+    os.replace(temp_path, path)
+
+
+def _read_index(buffer, path: str, verify: bool) -> tuple[dict, int]:
+    """Validated JSON index of a compiled file and the offset of its first array"""
+    if len(buffer) < PACK_HEADER.size:
+        raise TablePackError(f"{path} is truncated")
+    magic, version, index_length, checksum = PACK_HEADER.unpack(bytes(buffer[:PACK_HEADER.size]))
+    if magic != PACK_MAGIC:
+        raise TablePackError(f"{path} is not a compiled table file")
+    if version != PACK_VERSION:
+        raise TablePackError(f"{path} has format version {version}, expected {PACK_VERSION}")
+    if verify and zlib.crc32(buffer[PACK_HEADER.size:]) != checksum:
+        raise TablePackError(f"{path} failed its checksum")
+    index = json.loads(bytes(buffer[PACK_HEADER.size:PACK_HEADER.size + index_length]))
+    return index["tables"], _align(PACK_HEADER.size + index_length)
+
+
+def read_pack(path: str, verify: bool = True) -> dict[str, Grid]:
+    """
+    Map `path` and return read-only numpy views of every table.
+    Raises `TablePackError` when the file is not a compiled table file of this version.
+    """
+    import numpy as np
+
+    try:
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    except (OSError, ValueError) as exc:
+        raise TablePackError(f"Cannot map {path}: {exc}") from exc
+    index, data_start = _read_index(mapped, path, verify)
+
+    def view(offset: int, dtype: str, shape: Sequence[int]) -> np.ndarray:
+        count = int(np.prod(shape))
+        start = data_start + offset
+        if start + count * 8 > len(mapped):
+            raise TablePackError(f"{path} is truncated")
+        return np.frombuffer(mapped, dtype, count, start).reshape(shape)
+
+    return {
+        name: (
+            tuple(view(offset, AXIS_DTYPE, (length,)) for offset, length in entry["axes"]),
+            view(entry["values"][0], VALUE_DTYPE, entry["values"][1]),
+        )
+        for name, entry in index.items()
+    }
+
+
+def read_pack_lists(path: str, verify: bool = True) -> dict[str, Grid]:
+    """Every table of `path` as plain lists, values nested by row"""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError as exc:
+        raise TablePackError(f"Cannot read {path}: {exc}") from exc
+    index, data_start = _read_index(data, path, verify)
+
+    def floats(offset: int, count: int) -> list[float]:
+        start = data_start + offset
+        if start + count * 8 > len(data):
+            raise TablePackError(f"{path} is truncated")
+        values = array('d', data[start:start + count * 8])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tolist()
+
+    grids = {}
+    for name, entry in index.items():
+        offset, shape = entry["values"]
+        values = floats(offset, _product(shape))
+        for size in reversed(shape[1:]):
+            values = [values[i:i + size] for i in range(0, len(values), size)]
+        grids[name] = ([floats(offset, length) for offset, length in entry["axes"]], values)
+    return grids
+
+
+def _product(shape: Sequence[int]) -> int:
+    count = 1
+    for size in shape:
+        count *= size
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', help="directory holding the CSV tables, default next to this file")
+    parser.add_argument('--output', help=f"compiled file, default {PACK_FILE} in the table directory")
+    parser.add_argument('--check', action='store_true', help="only verify the compiled file")
+    args = parser.parse_args()
+
+    import tables
+
+    directory = args.directory or TABLE_DIR
+    output = args.output or os.path.join(directory, PACK_FILE)
+    if args.check:
+        try:
+            read_pack(output)
+        except TablePackError as exc:
+            sys.exit(str(exc))
+        if not pack_is_current(directory, output):
+            sys.exit(f"{output} is older than the CSV tables, recompile it")
+        print(f"{output} is up to date")
+        return
+
+    grids = tables.compile_tables(directory, output)
+    print(f"Compiled {len(grids)} tables into {output} ({os.path.getsize(output)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
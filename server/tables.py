@@ -0,0 +1,313 @@
+"""
+Registry of the 737-800 performance tables.
+Every CSV is read and pivoted once, the interpolators are built up front and
+handlers only look them up. Files are re-read when their mtime changes.
+When an up to date compiled table file exists (see table_pack.py) it is
+memory-mapped instead and the CSVs are not parsed at all.
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Mapping
+
+import metrics
+from dense_lut import DenseLUT
+from performance import DerateTables, GridTable, derate_tables_from_grids
+from table_pack import (
+    DERATE_THRUSTS,
+    MAX_CLIMB_N1_FILE,
+    PACK_FILE,
+    TABLE_DIR,
+    TRIM_THRUSTS,
+    VREF_FILE,
+    Grid,
+    TablePackError,
+    all_table_files,
+    pack_is_current,
+    read_pack,
+    table_files,
+    write_pack,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# "grid" evaluates the grid tables directly, "lut" resamples the 2D tables
+# onto dense uniform grids at load time
+INTERP_ENGINES = ('grid', 'lut')
+
+Interpolator = GridTable | DenseLUT
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator(df: 'pd.DataFrame'):
+    """ creats an interpolation function to find N1 from an assumed dataset"""
+    # Create a 2D grid of the N1 values
+    n1_matrix = df.pivot(
+        index='Airport Pressure Altitude (ft)',
+        columns='Assumed Temperature (C)',
+        values='N1 (%)'
+    )
+
+    # Create the interpolation function, the pivot sorts both axes
+    return GridTable((n1_matrix.index.values, n1_matrix.columns.values), n1_matrix.values)
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator_min_assumed_temp(df: 'pd.DataFrame'):
+    """ creates an interpolation function for the minimum assumed temperature by pressure altitude"""
+    min_temps = df.groupby('Airport Pressure Altitude (ft)')['Minimum Assumed Temperature (C)'].first()
+
+    return GridTable((min_temps.index.values,), min_temps.values)
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator_stab_trim(df: 'pd.DataFrame'):
+    trim_matrix = df.pivot(
+        index='Weight(kg)',
+        columns='CG(%MAC)',
+        values='Trim'
+    )
+
+    return GridTable((trim_matrix.index.values, trim_matrix.columns.values), trim_matrix.values)
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator_n1_reduction(df: 'pd.DataFrame'):
+    n1_red_matrix = df.pivot(
+        index='Assumed Temp Minus OAT',
+        columns='OAT',
+        values='N1(%) Reduction'
+    )
+
+    return GridTable((n1_red_matrix.index.values, n1_red_matrix.columns.values), n1_red_matrix.values)
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator_n1_max(df: 'pd.DataFrame'):
+    n1_matrix = df.pivot(
+        index='TAT(C)',
+        columns='Pressure Altitude(ft)',
+        values='N1(%)'
+    )
+
+    return GridTable((n1_matrix.index.values, n1_matrix.columns.values), n1_matrix.values)
+
+
+@metrics.stage_seconds.timed('interpolator_build')
+def create_interpolator_vref(df: 'pd.DataFrame'):
+    vref_matrix = df.pivot(
+        index='Weight',
+        columns='Flaps',
+        values='VREF'
+    )
+
+    return GridTable((vref_matrix.index.values, vref_matrix.columns.values), vref_matrix.values)
+
+
+def read_table(path: str, columns: list[str]) -> 'pd.DataFrame':
+    """Read a CSV table and normalise its header to the names the interpolators expect"""
+    # pandas is only needed when the tables are compiled or no compiled file exists
+    import pandas as pd
+
+    with metrics.stage_seconds.time('csv_load'):
+        df = pd.read_csv(path)
+    df.columns = columns
+    return df
+
+
+@dataclass(frozen=True)
+class PerformanceTables:
+    """Immutable snapshot of every table, keyed by thrust rating"""
+    derates: Mapping[str, DerateTables]
+    max_climb_n1: Interpolator
+    vref: GridTable
+    generation: int
+    engine: str = 'grid'
+
+    def lut_error_bound(self) -> float:
+        """Worst error of the dense lookup tables against the grid tables"""
+        luts = [self.max_climb_n1]
+        for derate_tables in self.derates.values():
+            luts.extend((derate_tables.n1, derate_tables.n1_reduction, derate_tables.stab_trim))
+        return max((lut.max_error for lut in luts if isinstance(lut, DenseLUT)), default=0.0)
+
+
+def with_engine(interp_func: GridTable, engine: str) -> Interpolator:
+    if engine != 'lut':
+        return interp_func
+    with metrics.stage_seconds.time('interpolator_build'):
+        return DenseLUT(interp_func)
+
+
+def load_derate_tables(directory: str, thrust: str, engine: str = 'grid') -> DerateTables:
+    files = table_files(thrust)
+    n1_df = read_table(os.path.join(directory, files['n1']),
+                       ['Assumed Temperature (C)', 'Airport Pressure Altitude (ft)',
+                        'N1 (%)', 'Minimum Assumed Temperature (C)'])
+    n1_red_df = read_table(os.path.join(directory, files['n1_reduction']),
+                           ['Assumed Temp Minus OAT', 'OAT', 'N1(%) Reduction'])
+    stab_trim = None
+    if 'stab_trim' in files:
+        stab_trim = with_engine(create_interpolator_stab_trim(
+            read_table(os.path.join(directory, files['stab_trim']), ['Weight(kg)', 'CG(%MAC)', 'Trim'])), engine)
+
+    return DerateTables(
+        n1=with_engine(create_interpolator(n1_df), engine),
+        min_assumed_temp=create_interpolator_min_assumed_temp(n1_df),
+        n1_reduction=with_engine(create_interpolator_n1_reduction(n1_red_df), engine),
+        stab_trim=stab_trim,
+    )
+
+
+def load_csv_tables(directory: str = TABLE_DIR, generation: int = 0, engine: str = 'grid') -> PerformanceTables:
+    """Read every CSV in `directory` and build a fresh table snapshot"""
+    derates = {thrust: load_derate_tables(directory, thrust, engine) for thrust in DERATE_THRUSTS}
+    max_climb_n1 = read_table(os.path.join(directory, MAX_CLIMB_N1_FILE),
+                              ['TAT(C)', 'Pressure Altitude(ft)', 'N1(%)'])
+    vref = read_table(os.path.join(directory, VREF_FILE), ['Weight', 'Flaps', 'VREF'])
+
+    return PerformanceTables(
+        derates=MappingProxyType(derates),
+        max_climb_n1=with_engine(create_interpolator_n1_max(max_climb_n1), engine),
+        vref=create_interpolator_vref(vref),
+        generation=generation,
+        engine=engine,
+    )
+
+
+def table_grids(tables: PerformanceTables) -> dict[str, Grid]:
+    """Axes and values of every table in a "grid" engine snapshot, keyed by their name in the compiled file"""
+    interpolators: dict[str, GridTable | None] = {
+        'max_climb_n1': tables.max_climb_n1,
+        'vref': tables.vref,
+    }
+    for thrust, derate_tables in tables.derates.items():
+        interpolators[f'n1-{thrust}'] = derate_tables.n1
+        interpolators[f'min_assumed_temp-{thrust}'] = derate_tables.min_assumed_temp
+        interpolators[f'n1_reduction-{thrust}'] = derate_tables.n1_reduction
+        interpolators[f'stab_trim-{thrust}'] = derate_tables.stab_trim
+    return {
+        name: (interp.grid, interp.values)
+        for name, interp in interpolators.items() if interp is not None
+    }
+
+
+def compile_tables(directory: str = TABLE_DIR, output: str | None = None) -> dict[str, Grid]:
+    """Compile every CSV in `directory` into one memory-mappable file"""
+    grids = table_grids(load_csv_tables(directory))
+    write_pack(output or os.path.join(directory, PACK_FILE), grids)
+    return grids
+
+
+def load_pack_tables(path: str, generation: int = 0, engine: str = 'grid') -> PerformanceTables:
+    """Build a table snapshot on top of the memory-mapped compiled file"""
+    with metrics.stage_seconds.time('table_map'):
+        grids = read_pack(path)
+    axes, values = grids['max_climb_n1']
+    max_climb_n1 = GridTable(axes, values)
+    axes, values = grids['vref']
+    return PerformanceTables(
+        derates=MappingProxyType({
+            thrust: derate_tables_from_grids(grids, thrust, lambda table: with_engine(table, engine))
+            for thrust in DERATE_THRUSTS
+        }),
+        max_climb_n1=with_engine(max_climb_n1, engine),
+        vref=GridTable(axes, values),
+        generation=generation,
+        engine=engine,
+    )
+
+
+def load_tables(directory: str = TABLE_DIR, generation: int = 0, engine: str = 'grid') -> PerformanceTables:
+    """Fresh table snapshot, from the compiled file when it is up to date, otherwise from the CSVs"""
+    if engine not in INTERP_ENGINES:
+        raise ValueError(f"Unknown interpolation engine {engine!r}, expected one of {INTERP_ENGINES}")
+    path = os.path.join(directory, PACK_FILE)
+    if pack_is_current(directory, path):
+        try:
+            return load_pack_tables(path, generation, engine)
+        except (TablePackError, KeyError) as exc:
+            logger.warning("Ignoring compiled tables: %s", exc)
+    elif os.path.exists(path):
+        logger.warning("%s is older than the CSV tables, reading the CSVs. Run table_pack.py to recompile it", PACK_FILE)
+    return load_csv_tables(directory, generation, engine)
+
+
+class TableRegistry:
+    """
+    Holds the current `PerformanceTables` snapshot.
+    The snapshot is replaced as a whole when a table file changes on disk, so a
+    handler that grabbed `tables` keeps a consistent view for its whole request.
+    """
+
+    def __init__(self, directory: str = TABLE_DIR, check_interval: float = 1.0, engine: str = 'grid',
+                 compile_pack: bool = False):
+        self.directory = directory
+        self.engine = engine
+        # recompile a missing or stale compiled file before loading, so that every
+        # worker maps the same file instead of parsing its own copy of the CSVs
+        self.compile_pack = compile_pack
+        # minimum seconds between two mtime checks
+        self.check_interval = check_interval
+        self._tables: PerformanceTables | None = None
+        self._mtimes: dict[str, float] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        # called with the new snapshot after every (re)load
+        self._listeners: list[Callable[[PerformanceTables], None]] = []
+
+    def add_listener(self, callback: Callable[[PerformanceTables], None]):
+        self._listeners.append(callback)
+
+    def _read_mtimes(self) -> dict[str, float]:
+        mtimes = {}
+        for name in all_table_files() + [PACK_FILE]:
+            try:
+                mtimes[name] = os.stat(os.path.join(self.directory, name)).st_mtime
+            except FileNotFoundError:
+                pass
+        return mtimes
+
+    def load(self) -> PerformanceTables:
+        """(Re)load every table unconditionally"""
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> PerformanceTables:
+        if self.compile_pack and not pack_is_current(self.directory):
+            compile_tables(self.directory)
+        mtimes = self._read_mtimes()
+        generation = self._tables.generation + 1 if self._tables is not None else 0
+        self._tables = load_tables(self.directory, generation, self.engine)
+        self._mtimes = mtimes
+        self._last_check = time.monotonic()
+        for callback in self._listeners:
+            callback(self._tables)
+        return self._tables
+
+    def reload_if_changed(self) -> bool:
+        """Reload the tables if any file changed since the last load"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            if self._tables is not None and self._read_mtimes() == self._mtimes:
+                return False
+            self._load()
+            return True
+
+    @property
+    def tables(self) -> PerformanceTables:
+        if self._tables is None or time.monotonic() - self._last_check >= self.check_interval:
+            self.reload_if_changed()
+        assert self._tables is not None
+        return self._tables
+
+    def derate(self, thrust: str) -> DerateTables:
+        return self.tables.derates[thrust]
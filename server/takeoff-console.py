@@ -1,27 +1,110 @@
-""" Simple script to calculate takeoff thrust """
+"""
+Simple script to calculate takeoff thrust
 
-print("Loading Data...")
+    python takeoff-console.py                               one N1, asked for interactively
+    python takeoff-console.py --batch scenarios.csv         every scenario of a file, - for stdin
+    python takeoff-console.py --batch - --format ndjson --workers 8 < scenarios.ndjson > results.ndjson
 
-from main import find_n1, create_interpolator
-import pandas as pd
+Batch input is CSV with a header line or NDJSON, one scenario per line, with
+the columns derate (TO, TO-1, TO-2), assumed_temp, press_altitude, oat and
+bleeds for N1, and derate, weight and cg for stab trim. Every line is written
+back unchanged with n1 and trim appended, computed as /takeoff/derate and
+/takeoff/trim do. Results that cannot be computed are empty (CSV) or null,
+an NDJSON line that is not a JSON object is written as an error record.
+"""
 
-# Read the data from the CSV file
+import argparse
+import sys
 
-derates = {
-    'TO': 'data-26K.csv',
-    'TO-1': 'data-24K.csv',
-    'TO-2': 'data-22K.csv'
-}
 
-df_in = pd.read_csv(derates[input('Derate')])
+def interactive():
+    print("Loading Data...")
 
-# Create an interpolation function for N1
-df_in.columns = ['Assumed Temperature (C)', 'Airport Pressure Altitude (ft)',
-                 'N1 (%)', 'Minimum Assumed Temperature (C)']
+    from performance import PACK_PATH, derates, find_n1, read_derate_tables
+    from table_pack import TABLE_DIR, TablePackError, pack_is_current
 
-# Example usage
-press_altitude_in = int(input('Enter pressure altitude'))
-assumed_temp_in = int(input('Enter assumed temp'))
-n1 = find_n1(press_altitude_in, assumed_temp_in, create_interpolator(df_in))
+    # Read the tables of the chosen derate, from the compiled file when it is newer than the CSVs
 
-print(f'Interpolated N1: {n1} %')
+    thrust = derates[input('Derate')]
+
+    derate_tables = None
+    if pack_is_current(TABLE_DIR, PACK_PATH):
+        try:
+            derate_tables = read_derate_tables(thrust)
+        except (TablePackError, KeyError) as exc:
+            print(f"Ignoring compiled tables: {exc}")
+    if derate_tables is None:
+        from tables import load_derate_tables
+
+        derate_tables = load_derate_tables(TABLE_DIR, thrust)
+
+    # Example usage
+    press_altitude_in = int(input('Enter pressure altitude'))
+    assumed_temp_in = int(input('Enter assumed temp'))
+    n1 = find_n1(press_altitude_in, assumed_temp_in, derate_tables.n1)
+
+    print(f'Interpolated N1: {n1} %')
+
+
+def read_chunks(file, chunk_rows: int):
+    """Lists of up to `chunk_rows` lines, read as they are needed"""
+    from itertools import islice
+
+    while chunk := list(islice(file, chunk_rows)):
+        yield chunk
+
+
+def run_batch(args: argparse.Namespace):
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    import batch
+
+    output_format = args.format or ('ndjson' if args.batch.endswith(('.ndjson', '.jsonl')) else 'csv')
+    source = sys.stdin if args.batch == '-' else open(args.batch, newline='')
+    out = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    with source, out:
+        if output_format == 'csv':
+            header_line = source.readline()
+            header = batch.scenario_header(header_line)
+            out.write((",".join([header_line.rstrip('\r\n')] + batch.result_columns(header)) + "\n").encode())
+            process = partial(batch.process_csv_scenarios, header=header)
+        else:
+            process = batch.process_ndjson_scenarios
+
+        chunks = read_chunks(source, args.chunk_rows)
+        if args.workers <= 1:
+            for chunk in chunks:
+                out.write(process(chunk))
+            return
+
+        # results are written in input order, at most two chunks per worker are in flight
+        with ProcessPoolExecutor(args.workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(process, chunk))
+                if len(pending) >= 2 * args.workers:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch', metavar='PATH', help="scenario file to evaluate, - for stdin")
+    parser.add_argument('--format', choices=('csv', 'ndjson'),
+                        help="format of the scenarios and results, from the file extension by default")
+    parser.add_argument('--output', default='-', help="result file, stdout by default")
+    parser.add_argument('--workers', type=int, default=1, help="processes evaluating chunks in parallel")
+    parser.add_argument('--chunk-rows', type=int, default=65536, help="scenarios evaluated at a time")
+    args = parser.parse_args()
+
+    if args.batch is None:
+        interactive()
+    else:
+        run_batch(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Telemetry derived from the shared X-Plane value cache.
+Every RREF packet is turned into one `TelemetrySnapshot`, which is then fanned
+out to any number of subscribers (websocket clients). Fifty browser tabs cost
+the same X-Plane traffic and CPU as one.
+"""
+
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import metrics
+from derived import DerivedGraph
+from performance import derates, stab_trim_setting
+from tables import Interpolator, PerformanceTables, TableRegistry
+from x_plane_udp import XPlaneIpNotFound, XPlaneTimeout
+from shared_xplane import SharedXPlaneConnection
+from xplane_connection import XPlaneConnection
+
+
+WEIGHT_DATAREF = "sim/flightmodel/weight/m_total"
+CG_DATAREF = "sim/cockpit2/gauges/indicators/CG_indicator"
+BARO_DATAREF = "sim/weather/barometer_current_inhg"
+TAT_DATAREF = "sim/cockpit2/temperature/outside_air_temp_deg"
+
+TELEMETRY_DATAREFS = (WEIGHT_DATAREF, CG_DATAREF, BARO_DATAREF, TAT_DATAREF)
+# graph inputs besides the datarefs: the table snapshot in use and its max climb N1 interpolator
+TABLES_INPUT = "tables"
+MAX_N1_INPUT = "max_climb_n1"
+
+# LEMAC: 793 in
+LEMAC_INCHES = 793
+
+
+def pressure_altitude(stat_press_inhg: float) -> float:
+    """Pressure altitude in ft from the static pressure in inHg"""
+    stat_press_hpa = stat_press_inhg * 33.8639
+    return 145366.45 * (1 - (stat_press_hpa/1013.25)**0.190284)
+
+
+def cg_inches(cg: float) -> float:
+    return LEMAC_INCHES * (cg + 1)
+
+
+def find_max_n1(tat: float, press_alt: float, interp_func: Interpolator) -> float:
+    return float(interp_func((tat, press_alt)))
+
+
+def clamp_tat(tat: float) -> float:
+    """TAT clamped into the max climb N1 chart"""
+    return min(max(tat, -40), 0)
+
+
+def clamp_press_alt(press_alt: float) -> float:
+    """Pressure altitude clamped into the max climb N1 chart"""
+    return min(max(press_alt, 0), 41000)
+
+
+def max_climb_n1(tat: float, press_alt: float, interp_func: Interpolator) -> float:
+    """Max climb N1 with TAT and pressure altitude clamped into the chart"""
+    return find_max_n1(clamp_tat(tat), clamp_press_alt(press_alt), interp_func)
+
+
+def stab_trims(weight: float, cg_mac: float, tables: PerformanceTables) -> dict[str, float | None]:
+    """Stab trim of every derate with a trim table, None outside the table"""
+    trims = {}
+    for derate, thrust in derates.items():
+        derate_tables = tables.derates[thrust]
+        if derate_tables.stab_trim is not None:
+            try:
+                trims[derate] = stab_trim_setting(weight, cg_mac, derate_tables)
+            except ValueError:
+                trims[derate] = None
+    return trims
+
+
+def telemetry_graph() -> DerivedGraph:
+    """
+    Values derived from the TELEMETRY_DATAREFS, TABLES_INPUT and MAX_N1_INPUT.
+    Nodes: press_alt, clamped_tat, clamped_press_alt, max_n1, cg_mac, cg_inches and
+    trim (by derate). A new barometer value recomputes the pressure altitude and
+    max N1 only, a new weight only the trim.
+    """
+    def interpolate_max_n1(tat: float, press_alt: float, interp_func: Interpolator) -> float:
+        with metrics.stage_seconds.time('interpolation'):
+            return find_max_n1(tat, press_alt, interp_func)
+
+    graph = DerivedGraph()
+    graph.derive("press_alt", [BARO_DATAREF], pressure_altitude)
+    graph.derive("clamped_tat", [TAT_DATAREF], clamp_tat)
+    graph.derive("clamped_press_alt", ["press_alt"], clamp_press_alt)
+    graph.derive("max_n1", ["clamped_tat", "clamped_press_alt", MAX_N1_INPUT], interpolate_max_n1)
+    graph.derive("cg_mac", [CG_DATAREF], lambda cg: cg * 100)
+    graph.derive("cg_inches", [CG_DATAREF], cg_inches)
+    graph.derive("trim", [WEIGHT_DATAREF, "cg_mac", TABLES_INPUT], stab_trims)
+    return graph
+
+
+@dataclass(frozen=True)
+class TelemetrySnapshot:
+    """Values derived from one RREF packet, None until their datarefs arrive"""
+    connected: bool
+    max_n1: float | None = None
+    press_alt: float | None = None
+    tat: float | None = None
+    weight: float | None = None
+    cg_mac: float | None = None
+    cg_inches: float | None = None
+    timestamp: float = 0.0  # time.monotonic() of the packet
+
+    def to_message(self) -> dict:
+        if not self.connected:
+            return {
+                "success": False,
+                "message": "No X-Plane Instance Found"
+            }
+        message = {"success": True, "message": "Success"}
+        message.update(
+            (key, value) for key, value in asdict(self).items() if key not in ("connected", "timestamp"))
+        return message
+
+
+def derive_snapshot(graph: DerivedGraph, connected: bool) -> TelemetrySnapshot:
+    """Snapshot of a `telemetry_graph`, only the nodes whose inputs changed are recomputed"""
+    if not connected:
+        return TelemetrySnapshot(connected=False, timestamp=time.monotonic())
+
+    return TelemetrySnapshot(
+        connected=True,
+        max_n1=graph.get("max_n1"),
+        press_alt=graph.get("press_alt"),
+        tat=graph.get(TAT_DATAREF),
+        weight=graph.get(WEIGHT_DATAREF),
+        cg_mac=graph.get("cg_mac"),
+        cg_inches=graph.get("cg_inches"),
+        timestamp=time.monotonic(),
+    )
+
+
+@dataclass(frozen=True)
+class Deadband:
+    """Smallest TAT and pressure altitude moves worth pushing a new max N1 for"""
+    tat: float = 0.5
+    press_alt: float = 50.0
+
+    def exceeded(self, sent: TelemetrySnapshot | None, snapshot: TelemetrySnapshot) -> bool:
+        """
+        True if `snapshot` should be pushed to a client that was last sent `sent`.
+        Moves are measured from the last pushed values, so a slow drift is still
+        pushed once it adds up. Connecting, disconnecting and a max N1 appearing
+        or going away are always pushed.
+        """
+        if sent is None or sent.connected != snapshot.connected \
+                or (sent.max_n1 is None) != (snapshot.max_n1 is None):
+            return True
+        if snapshot.max_n1 is None:
+            return False
+        return abs(snapshot.tat - sent.tat) >= self.tat or abs(snapshot.press_alt - sent.press_alt) >= self.press_alt
+
+
+class TelemetryHub:
+    """
+    Derives a `TelemetrySnapshot` once per packet and fans it out.
+    Every subscriber gets a queue holding only the newest snapshot, so a slow
+    client skips stale frames instead of building a backlog.
+    """
+
+    def __init__(self, xplane: XPlaneConnection | SharedXPlaneConnection, table_registry: TableRegistry):
+        self.xplane = xplane
+        self.table_registry = table_registry
+        self.derived = telemetry_graph()
+        self.latest = TelemetrySnapshot(connected=False)
+        self._subscribers: set[asyncio.Queue] = set()
+        # called with every new snapshot
+        self._listeners: list[Callable[[TelemetrySnapshot], None]] = []
+
+    def start(self):
+        self.xplane.subscribe(*TELEMETRY_DATAREFS)
+        self.xplane.add_listener(self._values_changed)
+
+    def stop(self):
+        self.xplane.remove_listener(self._values_changed)
+
+    def _update_inputs(self):
+        self.derived.update(self.xplane.values, TELEMETRY_DATAREFS)
+        tables = self.table_registry.tables
+        self.derived.set(TABLES_INPUT, tables)
+        self.derived.set(MAX_N1_INPUT, tables.max_climb_n1)
+
+    def _values_changed(self, xplane: XPlaneConnection | SharedXPlaneConnection):
+        self._update_inputs()
+        self.latest = derive_snapshot(self.derived, xplane.connected)
+        for queue in self._subscribers:
+            publish_latest(queue, self.latest)
+        for callback in self._listeners:
+            callback(self.latest)
+
+    def value(self, name: str):
+        """Node `name` of the telemetry graph from the current X-Plane values, None until its datarefs arrive"""
+        self._update_inputs()
+        return self.derived.get(name)
+
+    def add_listener(self, callback: Callable[[TelemetrySnapshot], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[TelemetrySnapshot], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue receiving every new snapshot, primed with the current one"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        queue.put_nowait(self.latest)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def snapshot(self, timeout: float = 3.0) -> TelemetrySnapshot:
+        """
+        Latest snapshot once every telemetry dataref has arrived.
+        Raises `XPlaneIpNotFound` when X-Plane is not discovered in time and
+        `XPlaneTimeout` when it is but some values never come.
+        """
+        queue = self.subscribe()
+        try:
+            async with asyncio.timeout(timeout):
+                while True:
+                    snapshot = await queue.get()
+                    if snapshot.connected and None not in (
+                            snapshot.press_alt, snapshot.tat, snapshot.weight, snapshot.cg_mac):
+                        return snapshot
+        except TimeoutError as exc:
+            raise (XPlaneTimeout() if self.latest.connected else XPlaneIpNotFound()) from exc
+        finally:
+            self.unsubscribe(queue)
+
+
+def publish_latest(queue: asyncio.Queue, item):
+    """Put `item` on a size 1 queue, replacing whatever the consumer has not picked up yet"""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
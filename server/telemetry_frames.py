@@ -0,0 +1,98 @@
+"""
+Binary frames for the max N1 websocket, negotiated with the
+`takeoff-telemetry.v1` subprotocol. Clients that do not ask for it get the
+JSON messages of `TelemetrySnapshot.to_message`.
+
+Every frame starts with a frame type byte, integers are little endian:
+
+    0 schema        <BB field count, then per field <B name length and the UTF-8 name
+    1 update        <BHH changed mask, null mask, then a <d for every changed field that is not null
+    2 disconnected  <B  no X-Plane instance, the next update starts from all fields null
+
+The schema is sent once after subscribing, bit i of the masks is its field i.
+An update only carries the fields that changed since the previous frame of the
+connection, the first one is relative to all fields null. Client messages and
+errors stay JSON text frames on both protocols.
+"""
+
+import struct
+from dataclasses import fields
+
+from telemetry import TelemetrySnapshot
+
+
+SUBPROTOCOL = "takeoff-telemetry.v1"
+
+FRAME_SCHEMA = 0
+FRAME_UPDATE = 1
+FRAME_DISCONNECTED = 2
+
+FIELDS = tuple(field.name for field in fields(TelemetrySnapshot) if field.name not in ('connected', 'timestamp'))
+
+UPDATE_HEADER = struct.Struct('<BHH')
+DISCONNECTED_FRAME = struct.pack('<B', FRAME_DISCONNECTED)
+
+
+def schema_frame() -> bytes:
+    names = [name.encode() for name in FIELDS]
+    return struct.pack('<BB', FRAME_SCHEMA, len(names)) + b''.join(
+        struct.pack('<B', len(name)) + name for name in names)
+
+
+class DeltaEncoder:
+    """Update frames of one connection, each relative to the frame sent before it"""
+
+    def __init__(self):
+        self._sent: tuple[float | None, ...] = (None,) * len(FIELDS)
+
+    def encode(self, snapshot: TelemetrySnapshot) -> bytes:
+        if not snapshot.connected:
+            self._sent = (None,) * len(FIELDS)
+            return DISCONNECTED_FRAME
+        current = tuple(getattr(snapshot, name) for name in FIELDS)
+        changed = 0
+        null = 0
+        values = []
+        for bit, (value, sent) in enumerate(zip(current, self._sent)):
+            if value == sent:
+                continue
+            changed |= 1 << bit
+            if value is None:
+                null |= 1 << bit
+            else:
+                values.append(value)
+        self._sent = current
+        return UPDATE_HEADER.pack(FRAME_UPDATE, changed, null) + struct.pack(f'<{len(values)}d', *values)
+
+
+class DeltaDecoder:
+    """Reference decoder, turns the frames of one connection back into JSON protocol messages"""
+
+    def __init__(self):
+        self.names: tuple[str, ...] = ()
+        self.message: dict | None = None
+
+    def decode(self, frame: bytes) -> dict | None:
+        """Message after `frame`, None for the schema"""
+        if frame[0] == FRAME_SCHEMA:
+            names = []
+            offset = 2
+            for _ in range(frame[1]):
+                length = frame[offset]
+                names.append(frame[offset + 1:offset + 1 + length].decode())
+                offset += 1 + length
+            self.names = tuple(names)
+            self.message = None
+            return None
+        if frame[0] == FRAME_DISCONNECTED:
+            self.message = {"success": False, "message": "No X-Plane Instance Found"}
+            return dict(self.message)
+
+        _type, changed, null = UPDATE_HEADER.unpack_from(frame)
+        if self.message is None or not self.message["success"]:
+            self.message = {"success": True, "message": "Success", **dict.fromkeys(self.names)}
+        values = iter(struct.unpack_from(f'<{(len(frame) - UPDATE_HEADER.size) // 8}d', frame, UPDATE_HEADER.size))
+        for bit, name in enumerate(self.names):
+            if changed >> bit & 1:
+                self.message[name] = None if null >> bit & 1 else next(values)
+        return dict(self.message)
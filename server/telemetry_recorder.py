@@ -0,0 +1,336 @@
+"""
+Append-only columnar recording of X-Plane telemetry, and its replay.
+Every RREF packet's records and every derived `TelemetrySnapshot` are buffered
+in fixed size NumPy chunks and written by a background thread. Memory stays
+bounded: when the writer falls behind, whole chunks are dropped and counted.
+
+    python telemetry_recorder.py info session.tkrec
+    python telemetry_recorder.py replay session.tkrec [--max-speed]
+    python telemetry_recorder.py serve session.tkrec     play it back as a fake X-Plane at 1x
+
+File layout: a sequence of self-describing chunks, each a `<4sII` header (magic,
+rows, meta length), a JSON meta (stream, columns, dataref names) and one array
+per column. Chunks are only written whole, a file cut short loses at most the
+chunk being written.
+"""
+
+import argparse
+import json
+import queue
+import struct
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Iterator, Mapping
+
+import numpy as np
+
+from telemetry import MAX_N1_INPUT, TELEMETRY_DATAREFS, TelemetrySnapshot, derive_snapshot, telemetry_graph
+from x_plane_udp import RREF_HEADER, RREF_RECORD, RrefValueStore, decode_rref
+
+
+CHUNK_MAGIC = b'TKRC'
+CHUNK_HEADER = struct.Struct('<4sII')
+
+# one row per RREF record, `packet` numbers the packets so they can be rebuilt
+PACKET_DTYPE = np.dtype([('received', '<f8'), ('packet', '<u4'), ('idx', '<i4'), ('value', '<f4')])
+# one row per snapshot, None is stored as NaN
+SNAPSHOT_FIELDS = tuple(field.name for field in fields(TelemetrySnapshot) if field.name not in ('connected', 'timestamp'))
+SNAPSHOT_DTYPE = np.dtype([('timestamp', '<f8'), ('connected', '?')] + [(name, '<f8') for name in SNAPSHOT_FIELDS])
+
+STREAMS = {'packets': PACKET_DTYPE, 'snapshots': SNAPSHOT_DTYPE}
+
+
+class TelemetryRecorder:
+    """
+    Records packets via `record_packet` (an `XPlaneConnection.on_packet` callback)
+    and snapshots via `record_snapshot` (a `TelemetryHub` listener).
+    """
+
+    def __init__(self, path: str, chunk_rows: int = 16384, flush_interval: float = 1.0, max_pending: int = 8,
+                 flush_rows: int | None = None):
+        self.path = path
+        # a partially filled chunk is written anyway once its first row is `flush_interval`
+        # seconds old or it holds `flush_rows` rows
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows or max(chunk_rows // 4, 1)
+        self.chunks_written = 0
+        self.chunks_dropped = 0
+        self._buffers = {name: np.empty(chunk_rows, dtype) for name, dtype in STREAMS.items()}
+        self._rows = {name: 0 for name in STREAMS}
+        self._oldest = {name: 0.0 for name in STREAMS}  # time.monotonic() of the first buffered row
+        self._packet = 0
+        # every dataref ever seen, RREF indices are never reused so names never change
+        self._datarefs: dict[int, str] = {}
+        self._live_datarefs: Mapping[int, str] = {}
+        self._live_size = 0
+        self._lock = threading.Lock()
+        # sealed chunks waiting for the writer, at most `max_pending` of them
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._file = open(path, 'ab')
+        self._writer = threading.Thread(target=self._write_loop, name="telemetry-recorder", daemon=True)
+        self._writer.start()
+
+    def record_packet(self, records: np.ndarray, received: float, datarefs: Mapping[int, str]):
+        now = time.monotonic()
+        with self._lock:
+            if datarefs is not self._live_datarefs or len(datarefs) != self._live_size:
+                self._datarefs.update(datarefs)
+                self._live_datarefs, self._live_size = datarefs, len(datarefs)
+            self._packet += 1
+            start = 0
+            while start < len(records):
+                buffer, rows = self._buffers['packets'], self._rows['packets']
+                if not rows:
+                    self._oldest['packets'] = now
+                count = min(len(records) - start, len(buffer) - rows)
+                chunk = buffer[rows:rows + count]
+                chunk['received'] = received
+                chunk['packet'] = self._packet
+                chunk['idx'] = records['idx'][start:start + count]
+                chunk['value'] = records['value'][start:start + count]
+                self._rows['packets'] += count
+                start += count
+                if self._rows['packets'] == len(buffer):
+                    self._seal('packets')
+            if self._due('packets', now):
+                self._seal('packets')
+
+    def record_snapshot(self, snapshot: TelemetrySnapshot):
+        now = time.monotonic()
+        with self._lock:
+            if not self._rows['snapshots']:
+                self._oldest['snapshots'] = now
+            row = self._buffers['snapshots'][self._rows['snapshots']]
+            row['timestamp'] = snapshot.timestamp
+            row['connected'] = snapshot.connected
+            for name in SNAPSHOT_FIELDS:
+                value = getattr(snapshot, name)
+                row[name] = np.nan if value is None else value
+            self._rows['snapshots'] += 1
+            if self._rows['snapshots'] == len(self._buffers['snapshots']) or self._due('snapshots', now):
+                self._seal('snapshots')
+
+    def _due(self, stream: str, now: float) -> bool:
+        """True if the partial chunk of `stream` should be written, must hold the lock"""
+        rows = self._rows[stream]
+        return bool(rows) and (rows >= self.flush_rows or now - self._oldest[stream] >= self.flush_interval)
+
+    def _seal(self, stream: str):
+        """Hand the filled part of a buffer to the writer, must hold the lock"""
+        rows = self._rows[stream]
+        if not rows:
+            return
+        meta = {"stream": stream, "columns": [[name, STREAMS[stream][name].str] for name in STREAMS[stream].names]}
+        if stream == 'packets':
+            meta["datarefs"] = {str(idx): name for idx, name in self._datarefs.items()}
+        try:
+            self._pending.put_nowait((meta, self._buffers[stream][:rows].copy()))
+        except queue.Full:
+            self.chunks_dropped += 1
+        self._rows[stream] = 0
+
+    def flush(self):
+        with self._lock:
+            for stream in STREAMS:
+                self._seal(stream)
+
+    def _flush_aged(self):
+        now = time.monotonic()
+        with self._lock:
+            for stream in STREAMS:
+                if self._due(stream, now):
+                    self._seal(stream)
+
+    def _write_loop(self):
+        while True:
+            try:
+                # also seals the partial chunk of a stream that stopped receiving rows
+                item = self._pending.get(timeout=self.flush_interval / 2)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                meta, rows = item
+                self._file.write(encode_chunk(meta, rows))
+                self._file.flush()
+                self.chunks_written += 1
+            self._flush_aged()
+
+    def close(self):
+        """Write everything buffered and close the file"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+        self._file.close()
+
+
+def encode_chunk(meta: dict, rows: np.ndarray) -> bytes:
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode()
+    columns = b"".join(np.ascontiguousarray(rows[name]).tobytes() for name in rows.dtype.names)
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, len(rows), len(meta_bytes)) + meta_bytes + columns
+
+
+def read_chunks(path: str) -> Iterator[tuple[dict, np.ndarray]]:
+    """(meta, rows) of every complete chunk, the rows as a structured array. Reads one chunk at a time"""
+    with open(path, 'rb') as file:
+        while len(header := file.read(CHUNK_HEADER.size)) == CHUNK_HEADER.size:
+            magic, count, meta_length = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC:
+                raise ValueError(f"{path} is not a telemetry recording")
+            meta_bytes = file.read(meta_length)
+            if len(meta_bytes) < meta_length:
+                break
+            meta = json.loads(meta_bytes)
+            dtype = np.dtype([(name, dtype) for name, dtype in meta["columns"]])
+            data = file.read(count * dtype.itemsize)
+            if len(data) < count * dtype.itemsize:
+                break
+            rows = np.empty(count, dtype)
+            offset = 0
+            for name in dtype.names:
+                rows[name] = np.frombuffer(data, dtype[name], count, offset)
+                offset += count * dtype[name].itemsize
+            yield meta, rows
+
+
+@dataclass
+class Recording:
+    packets: np.ndarray
+    snapshots: np.ndarray
+    datarefs: dict[int, str]
+
+    @property
+    def duration(self) -> float:
+        if not len(self.packets):
+            return 0.0
+        return float(self.packets['received'][-1] - self.packets['received'][0])
+
+
+def read_recording(path: str) -> Recording:
+    chunks: dict[str, list[np.ndarray]] = {stream: [] for stream in STREAMS}
+    datarefs: dict[int, str] = {}
+    for meta, rows in read_chunks(path):
+        chunks[meta["stream"]].append(rows)
+        datarefs.update((int(idx), name) for idx, name in meta.get("datarefs", {}).items())
+    return Recording(
+        packets=np.concatenate(chunks['packets']) if chunks['packets'] else np.empty(0, PACKET_DTYPE),
+        snapshots=np.concatenate(chunks['snapshots']) if chunks['snapshots'] else np.empty(0, SNAPSHOT_DTYPE),
+        datarefs=datarefs,
+    )
+
+
+def packet_bounds(recording: Recording) -> np.ndarray:
+    """Row index where every recorded packet starts, plus the end"""
+    starts = np.flatnonzero(np.diff(recording.packets['packet'], prepend=-1))
+    return np.append(starts, len(recording.packets))
+
+
+def replay(recording: Recording, interp_func, speed: float | None = 1.0) -> Iterator[tuple[float, TelemetrySnapshot]]:
+    """
+    Feed every recorded packet through RREF decoding, the value store and the
+    telemetry graph, paced at `speed` times real time or as fast as possible
+    when `speed` is None. Yields (recorded receive time, snapshot).
+    """
+    store = RrefValueStore()
+    for idx, dataref in recording.datarefs.items():
+        store.register(idx, dataref)
+    graph = telemetry_graph()
+    graph.set(MAX_N1_INPUT, interp_func)
+    records = np.empty(len(recording.packets), RREF_RECORD)
+    records['idx'] = recording.packets['idx']
+    records['value'] = recording.packets['value']
+
+    bounds = packet_bounds(recording)
+    start = time.monotonic()
+    first = float(recording.packets['received'][0]) if len(recording.packets) else 0.0
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        received = float(recording.packets['received'][begin])
+        if speed is not None:
+            delay = (received - first) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        packet = RREF_HEADER + records[begin:end].tobytes()
+        store.apply(decode_rref(packet), time.monotonic())
+        graph.update(store, TELEMETRY_DATAREFS)
+        yield received, derive_snapshot(graph, True)
+
+
+def recording_trajectories(recording: Recording) -> dict[str, object]:
+    """Step trajectories of every recorded dataref for `fake_xplane.FakeXPlane`, looping"""
+    packets = recording.packets
+    first = float(packets['received'][0])
+    duration = max(recording.duration, 1e-3)
+    trajectories = {}
+    for idx, dataref in recording.datarefs.items():
+        rows = packets[packets['idx'] == idx]
+        if not len(rows):
+            continue
+        times = rows['received'] - first
+        values = rows['value'].astype(float)
+
+        def trajectory(t: float, times=times, values=values) -> float:
+            return float(values[max(int(np.searchsorted(times, t % duration, side='right')) - 1, 0)])
+
+        trajectories[dataref] = trajectory
+    return trajectories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('info', 'replay', 'serve'))
+    parser.add_argument('path')
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed, 1 is real time")
+    parser.add_argument('--max-speed', action='store_true', help="replay as fast as possible")
+    parser.add_argument('--port', type=int, default=49000, help="port of the fake X-Plane for serve")
+    args = parser.parse_args()
+
+    recording = read_recording(args.path)
+    packet_count = len(packet_bounds(recording)) - 1
+    if args.command == 'info':
+        print(json.dumps({
+            "packets": packet_count,
+            "records": len(recording.packets),
+            "snapshots": len(recording.snapshots),
+            "datarefs": len(recording.datarefs),
+            "duration_s": recording.duration,
+        }, indent=2))
+        return
+
+    if args.command == 'serve':
+        from fake_xplane import FakeXPlane
+
+        with FakeXPlane(recording_trajectories(recording), port=args.port):
+            print(f"Replaying {args.path} as X-Plane on port {args.port}, looping every {recording.duration:.1f} s")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    import tables
+
+    interp_func = tables.load_tables().max_climb_n1
+    recorded = recording.snapshots[recording.snapshots['connected']]
+    deviation = 0.0
+    start = time.perf_counter()
+    for received, snapshot in replay(recording, interp_func, None if args.max_speed else args.speed):
+        # the snapshot the server derived from this packet is the first one after it
+        position = int(np.searchsorted(recorded['timestamp'], received))
+        if snapshot.max_n1 is not None and position < len(recorded) and not np.isnan(recorded['max_n1'][position]):
+            deviation = max(deviation, abs(snapshot.max_n1 - recorded['max_n1'][position]))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "packets": packet_count,
+        "elapsed_s": elapsed,
+        "packets_per_s": packet_count / elapsed if elapsed else None,
+        "max_n1_max_deviation": deviation,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
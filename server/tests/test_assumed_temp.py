@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_assumed_temp_never_below_fractional_minimum(client):
+    # 440 ft: minimum assumed temperature 29.12 C. The N1 of 29.6 C is reached up to
+    # 29.6 C, whose whole degree 29 C is below the minimum, so there is no legal answer
+    derate_tables = main.table_registry.tables.derates["26K"]
+    target_n1 = float(main.net_n1(np.array([29.6]), np.array([440.0]), np.array([0.0]), np.array([True]),
+                                  derate_tables)[0])
+    response = client.post('/takeoff/assumed-temp', json={
+        "derate": ["TO"], "press_altitude": [440], "oat": [0], "target_n1": [target_n1], "bleeds": [True],
+    }).json()
+
+    assert response["assumed_temp"] == [None]
+    assert response["n1"] == [None]
+
+
+def test_assumed_temp_at_or_above_minimum(client):
+    derate_tables = main.table_registry.tables.derates["26K"]
+    target_n1 = float(main.net_n1(np.array([35.5]), np.array([440.0]), np.array([0.0]), np.array([True]),
+                                  derate_tables)[0])
+    response = client.post('/takeoff/assumed-temp', json={
+        "derate": ["TO"], "press_altitude": [440], "oat": [0], "target_n1": [target_n1], "bleeds": [True],
+    }).json()
+
+    assert response["assumed_temp"] == [35]
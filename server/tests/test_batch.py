@@ -0,0 +1,23 @@
+import json
+
+import batch
+from tables import load_tables
+
+
+def test_ndjson_lines_that_are_not_objects_get_error_records():
+    lines = [
+        '{"derate": "TO", "weight": 60000, "cg": 20}\n',
+        '[1, 2]\n',
+        '3\n',
+        'not json\n',
+        '{}\n',
+    ]
+
+    out = [json.loads(line) for line in
+           batch.process_ndjson_scenarios(lines, load_tables()).decode().splitlines()]
+
+    assert out[0]["trim"] is not None
+    assert out[1] == {"error": "expected a JSON object", "input": "[1, 2]"}
+    assert out[2] == {"error": "expected a JSON object", "input": "3"}
+    assert out[3]["error"].startswith("invalid JSON") and out[3]["input"] == "not json"
+    assert out[4] == {}
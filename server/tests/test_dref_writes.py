@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from dref_writes import write_confirmed
+from fake_xplane import FakeXPlane
+from xplane_connection import XPlaneConnection
+
+
+DATAREF = "sim/test/x"
+
+
+@pytest.fixture
+def fake_xplane():
+    with FakeXPlane({DATAREF: 0.0, "sim/test/y": 0.0}) as fake:
+        yield fake
+
+
+async def overlapping_writes(xplane: XPlaneConnection) -> list:
+    async def second_write():
+        # starts while the first write is waiting for its read-back and ends after it
+        await asyncio.sleep(0.05)
+        return await write_confirmed(xplane, {DATAREF: 2.0}, wait=1.0)
+
+    first, second = await asyncio.gather(write_confirmed(xplane, {DATAREF: 1.0}, wait=1.0), second_write())
+    return first + second
+
+
+def test_overlapping_writes_of_one_dataref_are_both_confirmed(fake_xplane):
+    async def run():
+        xplane = XPlaneConnection(freq=20)
+        xplane.start()
+        try:
+            await xplane.wait_connected(5)
+            confirmations = await overlapping_writes(xplane)
+            return confirmations, DATAREF in xplane._udp.subscriptions.indices
+        finally:
+            await xplane.stop()
+
+    confirmations, still_streaming = asyncio.run(run())
+
+    assert [(c.value, c.confirmed) for c in confirmations] == [(1.0, True), (2.0, True)]
+    # the last release stops the stream the writes opened
+    assert not still_streaming
+
+
+def test_release_keeps_permanent_subscriptions(fake_xplane):
+    async def run():
+        xplane = XPlaneConnection(freq=20)
+        xplane.start()
+        try:
+            xplane.subscribe(DATAREF)
+            await xplane.wait_connected(5)
+            confirmations = await write_confirmed(xplane, {DATAREF: 3.0, "sim/test/y": 4.0}, wait=1.0)
+            indices = xplane._udp.subscriptions.indices
+            return confirmations, DATAREF in indices, "sim/test/y" in indices
+        finally:
+            await xplane.stop()
+
+    confirmations, subscribed, held = asyncio.run(run())
+
+    assert all(c.confirmed for c in confirmations)
+    assert subscribed and not held
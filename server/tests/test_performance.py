@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from performance import GridTable, derate_n1
+from tables import TABLE_DIR, load_csv_tables
+
+
+RegularGridInterpolator = pytest.importorskip("scipy.interpolate").RegularGridInterpolator
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return load_csv_tables(TABLE_DIR)
+
+
+def scipy_interpolator(table: GridTable):
+    values = np.array(table.values, dtype=float)
+    # read-only values keep scipy on `_evaluate_linear`, the order GridTable follows
+    values.flags.writeable = False
+    return RegularGridInterpolator(tuple(np.asarray(axis, dtype=float) for axis in table.grid), values)
+
+
+@pytest.mark.parametrize("thrust", ["26K", "24K", "22K"])
+def test_grid_table_matches_scipy_bit_for_bit(tables, thrust):
+    n1 = tables.derates[thrust].n1
+    alts, temps = n1.grid
+    points = np.stack(np.meshgrid(np.arange(alts[0], alts[-1] + 1, 50.0),
+                                  np.arange(temps[0], temps[-1] + 1, 1.0), indexing='ij'), axis=-1).reshape(-1, 2)
+    expected = scipy_interpolator(n1)(points)
+
+    np.testing.assert_array_equal(n1(points), expected)
+    assert [n1.find(*point) for point in points.tolist()] == expected.tolist()
+
+
+def test_derate_n1_rounds_like_scipy(tables):
+    derate_tables = tables.derates["26K"]
+    n1 = scipy_interpolator(derate_tables.n1)
+    reduction = scipy_interpolator(derate_tables.n1_reduction)
+    for press_altitude in range(-1000, 2001, 250):
+        for assumed_temp in range(20, 41):
+            for oat in range(-40, assumed_temp + 1, 5):
+                expected = round(float(n1((press_altitude, assumed_temp)))
+                                 - float(reduction((assumed_temp - oat, oat))), 1)
+                assert derate_n1(press_altitude, assumed_temp, oat, True, derate_tables) == expected
+
+
+def test_fractional_n1_is_not_rounded_away(tables):
+    # 26K, -750 ft, assumed temp 21, OAT -25 is 91.35000000000001 in scipy: 91.4, not 91.3
+    assert derate_n1(-750, 21, -25, True, tables.derates["26K"]) == 91.4
@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("axis", [
+    {"start": 0, "stop": 1e308, "step": 1e-300},
+    {"start": 0, "stop": "Infinity", "step": 1},
+    {"start": 0, "stop": 100_000, "step": 1},
+])
+def test_sweep_rejects_ranges_over_the_axis_limit(client, axis):
+    response = client.post('/takeoff/sweep', json={
+        "table": "trim", "weight": axis, "cg": [20],
+    })
+
+    assert response.status_code == 422
+
+
+def test_sweep_range_at_the_axis_limit():
+    assert main.AxisRange(start=0, stop=main.MAX_AXIS_VALUES - 1, step=1).count == main.MAX_AXIS_VALUES
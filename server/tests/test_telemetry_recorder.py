@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+
+from telemetry import TelemetrySnapshot
+from telemetry_recorder import TelemetryRecorder, read_chunks
+from x_plane_udp import RREF_RECORD
+
+
+def rref_records(count: int) -> np.ndarray:
+    records = np.zeros(count, RREF_RECORD)
+    records['idx'] = np.arange(count)
+    return records
+
+
+def test_partial_chunks_are_written_while_the_writer_is_busy(tmp_path):
+    path = str(tmp_path / "session.tkrec")
+    recorder = TelemetryRecorder(path, chunk_rows=64, flush_interval=0.2)
+    recorder.record_snapshot(TelemetrySnapshot(connected=True, timestamp=time.monotonic()))
+    # full packet chunks keep the writer queue busy, the lone snapshot still goes out by age
+    end = time.monotonic() + 1.0
+    while time.monotonic() < end:
+        recorder.record_packet(rref_records(64), time.monotonic(), {})
+        time.sleep(0.01)
+
+    assert [meta["stream"] for meta, _rows in read_chunks(path)].count("snapshots") == 1
+    recorder.close()
+
+
+def test_partial_chunks_are_written_at_the_row_count(tmp_path):
+    path = str(tmp_path / "session.tkrec")
+    recorder = TelemetryRecorder(path, chunk_rows=64, flush_interval=60, flush_rows=10)
+    recorder.record_packet(rref_records(12), time.monotonic(), {0: "sim/a"})
+    time.sleep(0.2)
+
+    assert [len(rows) for _meta, rows in read_chunks(path)] == [12]
+    recorder.close()
+
+
+def test_read_chunks_stops_at_a_truncated_chunk(tmp_path):
+    path = str(tmp_path / "session.tkrec")
+    recorder = TelemetryRecorder(path, chunk_rows=8)
+    recorder.record_packet(rref_records(8), 1.0, {})
+    recorder.record_packet(rref_records(8), 2.0, {})
+    recorder.close()
+    with open(path, 'rb+') as file:
+        file.truncate(file.seek(0, 2) - 1)
+
+    chunks = list(read_chunks(path))
+
+    assert len(chunks) == 1
+    assert chunks[0][1]['received'].tolist() == [1.0] * 8
@@ -0,0 +1,30 @@
+import struct
+
+from x_plane_udp import RREF_HEADER, decode_rref
+
+
+def rref_packet(*records: tuple[int, float]) -> bytes:
+    return RREF_HEADER + b"".join(struct.pack("<if", idx, value) for idx, value in records)
+
+
+def test_decode_rref_reads_only_the_received_bytes():
+    buffer = bytearray(64)
+    earlier = rref_packet((0, 1.0), (1, 2.0), (2, 3.0))
+    buffer[:len(earlier)] = earlier
+    packet = rref_packet((5, 7.5))
+    buffer[:len(packet)] = packet
+
+    records = decode_rref(buffer, len(packet))
+
+    assert records["idx"].tolist() == [5]
+    assert records["value"].tolist() == [7.5]
+
+
+def test_decode_rref_rejects_a_short_packet_over_an_earlier_header():
+    buffer = bytearray(64)
+    earlier = rref_packet((0, 1.0), (1, 2.0))
+    buffer[:len(earlier)] = earlier
+    # a 3 byte datagram leaves the rest of the earlier header in the buffer
+    buffer[:3] = b"RRE"
+
+    assert len(decode_rref(buffer, 3)) == 0
@@ -3,12 +3,21 @@ Class to get dataref values from XPlane Flight Simulator via network.
 License: GPLv3
 """
 
+import asyncio
 from dataclasses import dataclass
+import logging
 import socket
 import struct
-import binascii
-from time import sleep
+from time import monotonic, sleep
 import platform
+from typing import Callable, Iterable, Iterator, Mapping
+
+import numpy as np
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
 
 
 class XPlaneIpNotFound(Exception):
@@ -54,6 +63,311 @@ class XPlaneBeaconData:
     role: int
 
 
+# constants
+MCAST_GRP = "239.255.1.1"
+MCAST_PORT = 49707  # (MCAST_PORT was 49000 for XPlane10)
+# maximum bytes of an RREF answer X-Plane will send (Ethernet MTU - IP hdr - UDP hdr)
+MAX_PACKET_SIZE = 1472
+
+
+def open_beacon_socket() -> socket.socket:
+    """Open a UDP socket joined to the X-Plane beacon multicast group"""
+    sock = socket.socket(
+        socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if platform.system() == "Windows":
+        sock.bind(('', MCAST_PORT))
+    else:
+        sock.bind((MCAST_GRP, MCAST_PORT))
+    mreq = struct.pack("=4sl", socket.inet_aton(
+        MCAST_GRP), socket.INADDR_ANY)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+
+def decode_beacon(packet: bytes, sender: tuple[str, int]) -> XPlaneBeaconData | None:
+    """
+    Decode a BECN packet.
+    Returns None for packets that are not beacons.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("XPlane Beacon: %s", packet.hex())
+
+    # decode data
+    # * Header
+    header = packet[0:5]
+    if header != b"BECN\x00":
+        metrics.unknown_packets.inc(label="beacon")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Unknown packet from %s, %d bytes: %s", sender[0], len(packet), packet.hex())
+        return None
+
+    # * Data
+    data = packet[5:21]
+    # struct becn_struct
+    # {
+    # 	uchar beacon_major_version;		// 1 at the time of X-Plane 10.40
+    # 	uchar beacon_minor_version;		// 1 at the time of X-Plane 10.40
+    # 	xint application_host_id;			// 1 for X-Plane, 2 for PlaneMaker
+    # 	xint version_number;			// 104014 for X-Plane 10.40b14
+    # 	uint role;						// 1 for master, 2 for extern visual, 3 for IOS
+    # 	ushort port;						// port number X-Plane is listening on
+    # 	xchr	computer_name[strDIM];		// the hostname of the computer
+    # };
+    (
+        beacon_major_version,  # 1 at the time of X-Plane 10.40
+        beacon_minor_version,  # 1 at the time of X-Plane 10.40
+        application_host_id,   # 1 for X-Plane, 2 for PlaneMaker
+        xplane_version_number,  # 104014 for X-Plane 10.40b14
+        role,                  # 1 for master, 2 for extern visual, 3 for IOS
+        port,                  # port number X-Plane is listening on
+    ) = struct.unpack("<BBiiIH", data)
+    hostname = packet[21:]  # the hostname of the computer
+    hostname = hostname.split(b"\x00", 1)[0]
+    if beacon_major_version == 1 \
+            and beacon_minor_version <= 2 \
+            and application_host_id == 1:
+        logger.debug("X-Plane Beacon Version: %d.%d.%d",
+                     beacon_major_version, beacon_minor_version, application_host_id)
+        return XPlaneBeaconData(sender[0], port, hostname.decode(), xplane_version_number, role)
+
+    logger.warning("X-Plane Beacon Version not supported: %d.%d.%d",
+                   beacon_major_version, beacon_minor_version, application_host_id)
+    raise XPlaneVersionNotSupported()
+
+
+RREF_HEADER = b"RREF,"  # (was b"RREFO" for XPlane10)
+# * We get 8 bytes for every dataref sent:
+#   An integer for idx and the float value.
+RREF_RECORD = np.dtype([("idx", "<i4"), ("value", "<f4")])
+
+
+def decode_rref(data: bytes | bytearray, nbytes: int | None = None) -> np.ndarray:
+    """
+    View the records of an RREF answer as a structured array, without copying.
+    `nbytes` is the packet length when `data` is a larger receive buffer.
+    """
+    # only the received bytes, the rest of a reused buffer holds earlier packets
+    packet = memoryview(data)[:nbytes]
+    # * Read the Header "RREFO".
+    if packet[0:5] != RREF_HEADER:
+        metrics.unknown_packets.inc(label="rref")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Unknown packet: %s", packet.hex())
+        return np.empty(0, dtype=RREF_RECORD)
+    metrics.rref_packets.inc()
+    count = (len(packet) - 5) // RREF_RECORD.itemsize
+    return np.frombuffer(packet, dtype=RREF_RECORD, count=count, offset=5)
+
+
+class RrefValueStore(Mapping[str, float]):
+    """
+    Latest value of every subscribed dataref, stored in arrays indexed by the RREF index.
+    Reads like a read-only {dataref: value} dict of the datarefs received so far.
+    """
+
+    def __init__(self, capacity: int = 128):
+        self.values = np.zeros(capacity)
+        # time.monotonic() of the last packet carrying the dataref, 0 if never received
+        self.updated = np.zeros(capacity)
+        self.subscribed = np.zeros(capacity, dtype=bool)
+        self.indices: dict[str, int] = {}  # key = dataref, value = idx
+
+    def _grow(self, capacity: int):
+        self.values = np.resize(self.values, capacity)
+        self.updated = np.concatenate((self.updated, np.zeros(capacity - len(self.updated))))
+        self.subscribed = np.concatenate((self.subscribed, np.zeros(capacity - len(self.subscribed), dtype=bool)))
+
+    def register(self, idx: int, dataref: str):
+        if idx >= len(self.subscribed):
+            self._grow(max(idx + 1, 2 * len(self.subscribed)))
+        self.indices[dataref] = idx
+        self.subscribed[idx] = True
+        self.updated[idx] = 0
+
+    def unregister(self, dataref: str):
+        idx = self.indices.pop(dataref, None)
+        if idx is not None:
+            self.subscribed[idx] = False
+            self.updated[idx] = 0
+
+    def apply(self, records: np.ndarray, now: float) -> int:
+        """Store decoded RREF records, returns how many belonged to subscribed datarefs"""
+        idx = records["idx"]
+        in_range = (idx >= 0) & (idx < len(self.subscribed))
+        idx = idx[in_range]
+        value = records["value"][in_range]
+        subscribed = self.subscribed[idx]
+        idx = idx[subscribed]
+        value = value[subscribed].astype(np.float64)
+        # convert -0.0 values to positive 0.0
+        value[(value > -0.001) & (value < 0)] = 0.0
+        self.values[idx] = value
+        self.updated[idx] = now
+        return len(idx)
+
+    def updated_at(self, dataref: str) -> float | None:
+        """time.monotonic() of the last value received for `dataref`"""
+        idx = self.indices.get(dataref)
+        if idx is None or not self.updated[idx]:
+            return None
+        return float(self.updated[idx])
+
+    def clear(self):
+        self.updated[:] = 0
+
+    def __getitem__(self, dataref: str) -> float:
+        idx = self.indices[dataref]
+        if not self.updated[idx]:
+            raise KeyError(dataref)
+        return float(self.values[idx])
+
+    def __iter__(self) -> Iterator[str]:
+        return (dataref for dataref, idx in list(self.indices.items()) if self.updated[idx])
+
+    def __len__(self) -> int:
+        return sum(1 for _dataref in self)
+
+
+def pack_rref(freq: int, idx: int, dataref: str) -> bytes:
+    """RREF request asking XPlane to send `dataref` as `idx` `freq` times a second, 0 stops it"""
+    cmd = b"RREF\x00"
+    string = dataref.encode()
+    message = struct.pack("<5sii400s", cmd, freq, idx, string)
+    assert len(message) == 413
+    return message
+
+
+def pack_dref(dataref: str, value: float | int | bool) -> bytes:
+    """
+    DREF0+(4byte value)+dref_path+0+spaces to complete the whole message to 509 bytes.
+    X-Plane reads the value as a float whatever the dataref type, ints and bools included.
+    """
+    cmd = b"DREF\x00"
+    string = (dataref + '\x00').ljust(500).encode()
+    message = struct.pack("<5sf500s", cmd, float(value), string)
+    assert len(message) == 509
+    return message
+
+
+class _Pacer:
+    """Token bucket spacing out packets to XPlane"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = monotonic()
+
+    def reserve(self) -> float:
+        """Take a token, returns the seconds to wait before sending"""
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class DatarefSubscriptions:
+    """
+    RREF subscriptions of one socket.
+    Keeps the dataref <-> index map in both directions and sends bulk
+    (un)subscriptions paced by a token bucket instead of fixed sleeps.
+    Used as a context manager it unsubscribes everything on exit.
+    """
+
+    def __init__(self, send: Callable[[bytes], None], store: RrefValueStore,
+                 rate: float = 20000, burst: int = 1000):
+        self._send = send
+        self.store = store
+        self.datarefs: dict[int, str] = {}  # key = idx, value = dataref
+        self.indices: dict[str, int] = {}  # key = dataref, value = idx
+        self.freqs: dict[str, int] = {}  # key = dataref, value = requested frequency
+        # indices are never reused, XPlane may still be sending a dropped one
+        self._next_idx = 0
+        self._pacer = _Pacer(rate, burst)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unsubscribe_all(paced=False)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __contains__(self, dataref: str) -> bool:
+        return dataref in self.indices
+
+    def _subscribe_messages(self, datarefs: Iterable[str], freq: int) -> list[bytes]:
+        messages = []
+        for dataref in datarefs:
+            idx = self.indices.get(dataref)
+            if idx is None:
+                idx = self._next_idx
+                self._next_idx += 1
+                self.datarefs[idx] = dataref
+                self.indices[dataref] = idx
+                self.store.register(idx, dataref)
+            elif self.freqs[dataref] == freq:
+                continue
+            self.freqs[dataref] = freq
+            messages.append(pack_rref(freq, idx, dataref))
+        return messages
+
+    def _unsubscribe_messages(self, datarefs: Iterable[str]) -> list[bytes]:
+        messages = []
+        for dataref in datarefs:
+            idx = self.indices.pop(dataref, None)
+            if idx is None:
+                continue
+            del self.datarefs[idx]
+            del self.freqs[dataref]
+            self.store.unregister(dataref)
+            messages.append(pack_rref(0, idx, dataref))
+        return messages
+
+    def _send_paced(self, messages: list[bytes], paced: bool = True):
+        for message in messages:
+            if paced:
+                delay = self._pacer.reserve()
+                if delay:
+                    sleep(delay)
+            self._send(message)
+
+    async def _send_paced_async(self, messages: list[bytes]):
+        for message in messages:
+            delay = self._pacer.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            self._send(message)
+
+    def subscribe(self, datarefs: Iterable[str], freq: int, paced: bool = True) -> list[int]:
+        """Subscribe every dataref at `freq`, returns their indices"""
+        datarefs = list(datarefs)
+        self._send_paced(self._subscribe_messages(datarefs, freq), paced)
+        return [self.indices[dataref] for dataref in datarefs]
+
+    def unsubscribe(self, datarefs: Iterable[str], paced: bool = True):
+        self._send_paced(self._unsubscribe_messages(datarefs), paced)
+
+    def resubscribe(self, datarefs: Iterable[str], paced: bool = True):
+        """Send the RREF requests of subscribed `datarefs` again, for requests X-Plane never got"""
+        self._send_paced([pack_rref(self.freqs[dataref], self.indices[dataref], dataref)
+                          for dataref in datarefs if dataref in self.indices], paced)
+
+    def unsubscribe_all(self, paced: bool = True):
+        self.unsubscribe(list(self.indices), paced)
+
+    async def subscribe_async(self, datarefs: Iterable[str], freq: int) -> list[int]:
+        datarefs = list(datarefs)
+        await self._send_paced_async(self._subscribe_messages(datarefs, freq))
+        return [self.indices[dataref] for dataref in datarefs]
+
+    async def unsubscribe_async(self, datarefs: Iterable[str]):
+        await self._send_paced_async(self._unsubscribe_messages(datarefs))
+
+
 class XPlaneUdp:
     """
     Get data from XPlane via network.
@@ -61,50 +375,59 @@ class XPlaneUdp:
     """
 
     # constants
-    MCAST_GRP = "239.255.1.1"
-    MCAST_PORT = 49707  # (MCAST_PORT was 49000 for XPlane10)
+    MCAST_GRP = MCAST_GRP
+    MCAST_PORT = MCAST_PORT
 
     def __init__(self):
         # Open a UDP Socket to receive on Port 49000
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.settimeout(3.0)
-        # list of requested datarefs with index number
-        self.datarefidx = 0
-        self.datarefs = {}  # key = idx, value = dataref
         # values from xplane
         self.beacon_data = XPlaneBeaconData("", 0, "", 0, 0)
-        self.xplane_values = {}
+        self.xplane_values = RrefValueStore()
+        # requested datarefs with index number
+        self.subscriptions = DatarefSubscriptions(self._send, self.xplane_values)
+        self.datarefs = self.subscriptions.datarefs  # key = idx, value = dataref
+        # reused receive buffer, RREF packets are decoded straight out of it
+        self._buffer = bytearray(MAX_PACKET_SIZE)
         self.default_freq = 1
+        # called with the decoded records and time.monotonic() of every RREF packet,
+        # the records may be a view of the receive buffer and must be copied to be kept
+        self.on_packet: Callable[[np.ndarray, float], None] | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def __del__(self):
-        for _i in range(len(self.datarefs)):
-            self.add_data_ref(next(iter(self.datarefs.values())), freq=0)
+        self.close()
+
+    def close(self):
+        """Unsubscribe every dataref and close the socket"""
+        if self.socket.fileno() == -1:
+            return
+        if self.beacon_data.port:
+            self.subscriptions.unsubscribe_all(paced=False)
         self.socket.close()
-    
-    def execute_command(self, command: str):
-        message = struct.pack('<4sx500s', b'CMND', command.encode())
+
+
+    def _send(self, message: bytes):
         self.socket.sendto(
             message, (self.beacon_data.ip, self.beacon_data.port))
 
+    def execute_command(self, command: str):
+        message = struct.pack('<4sx500s', b'CMND', command.encode())
+        self._send(message)
+
     def write_data_ref(self, dataref: str, value: float | int | bool):
-        """
-        Write Dataref to XPlane
-        DREF0+(4byte byte value)+dref_path+0+spaces to complete the whole message to 509 bytes
-        """
-        cmd = b"DREF\x00"
-        dataref = dataref+'\x00'
-        string = dataref.ljust(500).encode()
-        message = "".encode()
-        if isinstance(value, float):
-            message = struct.pack("<5sf500s", cmd, value, string)
-        elif isinstance(value, int):
-            message = struct.pack("<5si500s", cmd, value, string)
-        elif isinstance(value, bool):
-            message = struct.pack("<5sI500s", cmd, int(value), string)
-
-        assert len(message) == 509
-        self.socket.sendto(
-            message, (self.beacon_data.ip, self.beacon_data.port))
+        """Write Dataref to XPlane"""
+        self._send(pack_dref(dataref, value))
+
+    def write_data_refs(self, values: Mapping[str, float | int | bool], paced: bool = True):
+        """Write every dataref in one burst, paced by the same token bucket as the subscriptions"""
+        self.subscriptions._send_paced([pack_dref(dataref, value) for dataref, value in values.items()], paced)
 
     def add_data_ref(self, dataref, freq: int | None=None):
         '''
@@ -112,64 +435,27 @@ class XPlaneUdp:
         You can disable a dataref by setting freq to 0. 
         '''
 
-        idx = -9999
-
         if freq is None:
             freq = self.default_freq
 
         if freq == 0:
-            if dataref not in self.xplane_values:
-                del self.datarefs[idx]
-                del self.xplane_values[dataref]
-
-            return
-
-        if dataref not in self.datarefs.values():
-            idx = self.datarefidx
-            self.datarefs[self.datarefidx] = dataref
-            self.datarefidx += 1
+            self.subscriptions.unsubscribe([dataref])
         else:
-            idx = list(self.datarefs.keys())[
-                list(self.datarefs.values()).index(dataref)]
-
-        cmd = b"RREF\x00"
-        string = dataref.encode()
-        message = struct.pack("<5sii400s", cmd, freq, idx, string)
-        assert len(message) == 413
-        self.socket.sendto(
-            message, (self.beacon_data.ip, self.beacon_data.port))
-        if self.datarefidx % 100 == 0:
-            sleep(0.2)
+            self.subscriptions.subscribe([dataref], freq)
 
     def get_values(self):
         """Get values of a dataref"""
         try:
             # Receive packet
-            # maximum bytes of an RREF answer X-Plane will send (Ethernet MTU - IP hdr - UDP hdr)
-            data, _addr = self.socket.recvfrom(1472)
+            nbytes = self.socket.recv_into(self._buffer)
             # Decode Packet
-            retvalues = {}
-            # * Read the Header "RREFO".
-            header = data[0:5]
-            if header != b"RREF,":  # (was b"RREFO" for XPlane10)
-                print("Unknown packet: ", binascii.hexlify(data))
-            else:
-                # * We get 8 bytes for every dataref sent:
-                #   An integer for idx and the float value.
-                values = data[5:]
-                lenvalue = 8
-                numvalues = int(len(values)/lenvalue)
-                for i in range(0, numvalues):
-                    singledata = data[(5+lenvalue*i):(5+lenvalue*(i+1))]
-                    (idx, value) = struct.unpack("<if", singledata)
-                    if idx in self.datarefs:
-                        # convert -0.0 values to positive 0.0
-                        if -0.001 < value < 0:
-                            value = 0.0
-                        retvalues[self.datarefs[idx]] = value
-            self.xplane_values.update(retvalues)
+            records = decode_rref(self._buffer, nbytes)
+            received = monotonic()
+            self.xplane_values.apply(records, received)
         except Exception as exc:
             raise XPlaneTimeout from exc
+        if self.on_packet is not None:
+            self.on_packet(records, received)
         return self.xplane_values
 
     def find_ip(self):
@@ -181,79 +467,16 @@ class XPlaneUdp:
         self.beacon_data = XPlaneBeaconData("", 0, "", 0, 0)
 
         # open socket for multicast group.
-        sock = socket.socket(
-            socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        if platform.system() == "Windows":
-            sock.bind(('', self.MCAST_PORT))
-        else:
-            sock.bind((self.MCAST_GRP, self.MCAST_PORT))
-        mreq = struct.pack("=4sl", socket.inet_aton(
-            self.MCAST_GRP), socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock = open_beacon_socket()
         sock.settimeout(3.0)
 
         # receive data
         try:
-            packet, sender = sock.recvfrom(1472)
-            print("XPlane Beacon: ", packet.hex())
-
-            # decode data
-            # * Header
-            header = packet[0:5]
-            if header != b"BECN\x00":
-                print("Unknown packet from "+sender[0])
-                print(str(len(packet)) + " bytes")
-                print(packet)
-                print(binascii.hexlify(packet))
-
-            else:
-                # * Data
-                data = packet[5:21]
-                # struct becn_struct
-                # {
-                # 	uchar beacon_major_version;		// 1 at the time of X-Plane 10.40
-                # 	uchar beacon_minor_version;		// 1 at the time of X-Plane 10.40
-                # 	xint application_host_id;			// 1 for X-Plane, 2 for PlaneMaker
-                # 	xint version_number;			// 104014 for X-Plane 10.40b14
-                # 	uint role;						// 1 for master, 2 for extern visual, 3 for IOS
-                # 	ushort port;						// port number X-Plane is listening on
-                # 	xchr	computer_name[strDIM];		// the hostname of the computer
-                # };
-                beacon_major_version = 0
-                beacon_minor_version = 0
-                application_host_id = 0
-                xplane_version_number = 0
-                role = 0
-                port = 0
-                (
-                    beacon_major_version,  # 1 at the time of X-Plane 10.40
-                    beacon_minor_version,  # 1 at the time of X-Plane 10.40
-                    application_host_id,   # 1 for X-Plane, 2 for PlaneMaker
-                    xplane_version_number,  # 104014 for X-Plane 10.40b14
-                    role,                  # 1 for master, 2 for extern visual, 3 for IOS
-                    port,                  # port number X-Plane is listening on
-                ) = struct.unpack("<BBiiIH", data)
-                hostname = packet[21:-1]  # the hostname of the computer
-                hostname = hostname[0:hostname.find(0)]
-                if beacon_major_version == 1 \
-                        and beacon_minor_version <= 2 \
-                        and application_host_id == 1:
-                    self.beacon_data.ip = sender[0]
-                    self.beacon_data.port = port
-                    self.beacon_data.hostname = hostname.decode()
-                    self.beacon_data.x_plane_version = xplane_version_number
-                    self.beacon_data.role = role
-                    print(
-                        f"X-Plane Beacon Version: {beacon_major_version}.{
-                          beacon_minor_version}.{application_host_id}"
-                        )
-                else:
-                    print(
-                        f"X-Plane Beacon Version not supported: {beacon_major_version}.{
-                          beacon_minor_version}.{application_host_id}"
-                        )
-                    raise XPlaneVersionNotSupported()
+            beacon = None
+            while beacon is None:
+                packet, sender = sock.recvfrom(MAX_PACKET_SIZE)
+                beacon = decode_beacon(packet, sender)
+            self.beacon_data = beacon
 
         except socket.timeout as timeout:
             raise XPlaneIpNotFound() from timeout
@@ -261,3 +484,123 @@ class XPlaneUdp:
             sock.close()
 
         return self.beacon_data
+
+
+class _BeaconProtocol(asyncio.DatagramProtocol):
+    """Resolves `found` with the first supported beacon heard on the multicast group"""
+
+    def __init__(self, found: asyncio.Future):
+        self.found = found
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        if self.found.done():
+            return
+        try:
+            beacon = decode_beacon(data, addr)
+        except XPlaneVersionNotSupported:
+            # e.g. PlaneMaker, keep listening for an X-Plane
+            return
+        if beacon is not None:
+            self.found.set_result(beacon)
+
+
+class _RrefProtocol(asyncio.DatagramProtocol):
+    """Hands every datagram received on the RREF socket to its `AsyncXPlaneUdp`"""
+
+    def __init__(self, udp_conn: "AsyncXPlaneUdp"):
+        self.udp_conn = udp_conn
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        self.udp_conn._packet_received(data)
+
+
+class AsyncXPlaneUdp(XPlaneUdp):
+    """
+    asyncio flavour of `XPlaneUdp`.
+    The RREF and beacon sockets are driven by the event loop, so `find_ip` and
+    `get_values` are awaitable and never block it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.socket.setblocking(False)
+        self.transport: asyncio.DatagramTransport | None = None
+        self._waiters: list[asyncio.Future] = []
+
+    def __del__(self):
+        if self.transport is not None:
+            self.transport.close()
+        self.socket.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _send(self, message: bytes):
+        if self.transport is None:
+            raise XPlaneIpNotFound("Call find_ip before sending to XPlane.")
+        self.transport.sendto(
+            message, (self.beacon_data.ip, self.beacon_data.port))
+
+    def _packet_received(self, data: bytes):
+        records = decode_rref(data)
+        received = monotonic()
+        self.xplane_values.apply(records, received)
+        if self.on_packet is not None:
+            self.on_packet(records, received)
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(self.xplane_values)
+
+    async def find_ip(self, timeout: float = 3.0):
+        '''
+        Find the IP of XPlane Host in Network.
+        It takes the first one it can find and opens the RREF transport to it.
+        '''
+        loop = asyncio.get_running_loop()
+        self.beacon_data = XPlaneBeaconData("", 0, "", 0, 0)
+
+        found = loop.create_future()
+        beacon_transport, _protocol = await loop.create_datagram_endpoint(
+            lambda: _BeaconProtocol(found), sock=open_beacon_socket())
+        try:
+            beacon = await asyncio.wait_for(found, timeout)
+        except asyncio.TimeoutError as timeout_error:
+            raise XPlaneIpNotFound() from timeout_error
+        finally:
+            beacon_transport.close()
+
+        return await self.open(beacon)
+
+    async def open(self, beacon: XPlaneBeaconData):
+        """Open the RREF transport to an X-Plane instance whose beacon was heard elsewhere"""
+        self.beacon_data = beacon
+        if self.transport is None:
+            self.transport, _protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _RrefProtocol(self), sock=self.socket)
+        return self.beacon_data
+
+    async def write_data_refs_async(self, values: Mapping[str, float | int | bool]):
+        """`write_data_refs` pacing without blocking the event loop"""
+        await self.subscriptions._send_paced_async(
+            [pack_dref(dataref, value) for dataref, value in values.items()])
+
+    async def get_values(self, timeout: float = 3.0):
+        """Wait for the next RREF packet and return the values of every dataref"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError as exc:
+            raise XPlaneTimeout from exc
+
+    def close(self):
+        """Unsubscribe every dataref and close the transport"""
+        if self.transport is None:
+            return
+        self.subscriptions.unsubscribe_all(paced=False)
+        self.transport.close()
+        self.transport = None
@@ -0,0 +1,230 @@
+"""
+Long-lived X-Plane connection shared by every endpoint.
+X-Plane is discovered once, the beacon is cached and dataref subscriptions stay
+alive. A background task keeps reading RREF packets into a value cache so
+endpoints only read the latest values. Discovery is re-run when the stream times out.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Mapping
+
+import numpy as np
+
+import metrics
+from x_plane_udp import AsyncXPlaneUdp, XPlaneBeaconData, XPlaneIpNotFound, XPlaneTimeout, XPlaneVersionNotSupported
+
+
+logger = logging.getLogger(__name__)
+
+
+class XPlaneConnection:
+    """Owns one `AsyncXPlaneUdp` and the latest value of every subscribed dataref"""
+
+    def __init__(self, freq: int = 5, retry_interval: float = 1.0,
+                 locate: Callable[[], Awaitable[XPlaneBeaconData]] | None = None):
+        # frequency X-Plane sends every subscribed dataref at
+        self.freq = freq
+        # pause between two failed discoveries
+        self.retry_interval = retry_interval
+        # beacon of the instance to connect to, raising XPlaneIpNotFound while it is not around.
+        # None connects to the first instance heard on the multicast group
+        self.locate = locate
+        self.beacon: XPlaneBeaconData | None = None
+        self._udp: AsyncXPlaneUdp | None = None
+        self._subscriptions: set[str] = set()
+        # datarefs streaming only while held, key = dataref, value = number of holders
+        self._holds: dict[str, int] = {}
+        # called with the connection after every packet and on disconnect
+        self._listeners: list[Callable[["XPlaneConnection"], None]] = []
+        # called with the records, receive time and {idx: dataref} map of every RREF packet
+        self.on_packet: Callable[[np.ndarray, float, Mapping[int, str]], None] | None = None
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def connected(self) -> bool:
+        return self._udp is not None
+
+    @property
+    def values(self) -> Mapping[str, float]:
+        """Latest value of every dataref received on the current connection"""
+        return self._udp.xplane_values if self._udp is not None else {}
+
+    def updated_at(self, dataref: str) -> float | None:
+        """time.monotonic() of the last packet carrying `dataref`"""
+        return self._udp.xplane_values.updated_at(dataref) if self._udp is not None else None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        # created here so the condition belongs to the serving event loop
+        self._changed = asyncio.Condition()
+        self._task = asyncio.create_task(self._run(), name="x-plane-connection")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    async def _connect(self):
+        udp_conn = AsyncXPlaneUdp()
+        start = time.perf_counter()
+        try:
+            if self.locate is None:
+                beacon = await udp_conn.find_ip()
+            else:
+                beacon = await udp_conn.open(await self.locate())
+        except BaseException:
+            udp_conn.close()
+            raise
+        metrics.stage_seconds.observe('beacon_discovery', time.perf_counter() - start)
+        logger.info("X-Plane found at %s:%d", beacon.ip, beacon.port)
+        udp_conn.on_packet = lambda records, received: self._packet_received(records, received, udp_conn.datarefs)
+        await udp_conn.subscriptions.subscribe_async(self._subscriptions | self._holds.keys(), self.freq)
+        async with self._changed:
+            self.beacon = beacon
+            self._udp = udp_conn
+            self._changed.notify_all()
+
+    async def _disconnect(self):
+        if self._udp is not None:
+            self._udp.close()
+        async with self._changed:
+            # stale values go with the connection they came from
+            self._udp = None
+            self.beacon = None
+            self._changed.notify_all()
+        self._notify_listeners()
+
+    async def _run(self):
+        while True:
+            if self._udp is None:
+                try:
+                    await self._connect()
+                except XPlaneIpNotFound:
+                    await asyncio.sleep(self.retry_interval)
+                except (XPlaneVersionNotSupported, OSError) as exc:
+                    logger.warning("X-Plane discovery failed, retrying: %s", exc)
+                    await asyncio.sleep(self.retry_interval)
+                continue
+
+            try:
+                await self._udp.get_values()
+            except XPlaneTimeout:
+                metrics.xplane_timeouts.inc(label="stream")
+                logger.warning("X-Plane connection timed out, rediscovering")
+                await self._disconnect()
+                continue
+
+            async with self._changed:
+                self._changed.notify_all()
+            self._notify_listeners()
+
+    def _packet_received(self, records: np.ndarray, received: float, datarefs: Mapping[int, str]):
+        if self.on_packet is not None:
+            self.on_packet(records, received, datarefs)
+
+    def add_listener(self, callback: Callable[["XPlaneConnection"], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[["XPlaneConnection"], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            callback(self)
+
+    def subscribe(self, *datarefs: str):
+        """Keep `datarefs` streaming from X-Plane from now on"""
+        new = [dataref for dataref in datarefs if dataref not in self._subscriptions]
+        self._subscriptions.update(new)
+        new = [dataref for dataref in new if dataref not in self._holds]
+        if new and self._udp is not None:
+            self._udp.subscriptions.subscribe(new, self.freq)
+
+    def hold(self, *datarefs: str):
+        """Stream `datarefs` until every hold on them is released, each call needs its `release`"""
+        new = []
+        for dataref in datarefs:
+            self._holds[dataref] = self._holds.get(dataref, 0) + 1
+            if self._holds[dataref] == 1 and dataref not in self._subscriptions:
+                new.append(dataref)
+        if new and self._udp is not None:
+            self._udp.subscriptions.subscribe(new, self.freq)
+
+    def release(self, *datarefs: str):
+        """Undo one `hold` of `datarefs`, the last release stops those not subscribed for good"""
+        gone = []
+        for dataref in datarefs:
+            if dataref not in self._holds:
+                continue
+            self._holds[dataref] -= 1
+            if not self._holds[dataref]:
+                del self._holds[dataref]
+                if dataref not in self._subscriptions:
+                    gone.append(dataref)
+        if gone and self._udp is not None:
+            self._udp.subscriptions.unsubscribe(gone)
+
+    def resubscribe(self, *datarefs: str):
+        """Ask X-Plane for subscribed `datarefs` again, in case the request was lost"""
+        if self._udp is not None:
+            self._udp.subscriptions.resubscribe(datarefs)
+
+    async def wait_connected(self, timeout: float = 3.0) -> AsyncXPlaneUdp:
+        """Wait until X-Plane has been discovered"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self._udp is not None or not self.running), timeout)
+            except asyncio.TimeoutError as exc:
+                raise XPlaneIpNotFound() from exc
+            if self._udp is None:
+                raise XPlaneIpNotFound()
+            return self._udp
+
+    async def get(self, dataref: str, timeout: float = 3.0) -> float:
+        """
+        Latest value of `dataref`.
+        Subscribes on first use and waits up to `timeout` for the first packet.
+        """
+        value = self.values.get(dataref)
+        if value is not None:
+            return value
+
+        self.subscribe(dataref)
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        await self.wait_connected(timeout)
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: dataref in self.values or self._udp is None),
+                    max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError as exc:
+                metrics.xplane_timeouts.inc(label="get")
+                raise XPlaneTimeout() from exc
+            if dataref not in self.values:
+                raise XPlaneIpNotFound()
+            # subscription to first value
+            metrics.stage_seconds.observe('rref_round_trip', time.perf_counter() - start)
+            return self.values[dataref]
+
+    async def write_data_ref(self, dataref: str, value: float | int | bool, timeout: float = 3.0):
+        (await self.wait_connected(timeout)).write_data_ref(dataref, value)
+
+    async def write_data_refs(self, values: Mapping[str, float | int | bool], timeout: float = 3.0):
+        """Write every dataref in one paced burst over the persistent socket"""
+        await (await self.wait_connected(timeout)).write_data_refs_async(values)
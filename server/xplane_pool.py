@@ -0,0 +1,154 @@
+"""
+Every X-Plane instance on the network, for serving a whole training floor from
+one process. A registry listens to the beacon multicast group for as long as
+the server runs and remembers when each instance was last heard. The pool keeps
+one persistent `XPlaneConnection` per instance that has been asked for.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from x_plane_udp import (
+    XPlaneBeaconData,
+    XPlaneIpNotFound,
+    XPlaneVersionNotSupported,
+    decode_beacon,
+    open_beacon_socket,
+)
+from xplane_connection import XPlaneConnection
+
+
+logger = logging.getLogger(__name__)
+
+
+def sim_key(beacon: XPlaneBeaconData) -> str:
+    return f"{beacon.ip}:{beacon.port}"
+
+
+@dataclass(frozen=True)
+class SimBeacon:
+    beacon: XPlaneBeaconData
+    last_seen: float  # time.monotonic() of the last beacon
+
+    @property
+    def key(self) -> str:
+        return sim_key(self.beacon)
+
+
+class _RegistryProtocol(asyncio.DatagramProtocol):
+    """Hands every beacon heard on the multicast group to its `BeaconRegistry`"""
+
+    def __init__(self, registry: "BeaconRegistry"):
+        self.registry = registry
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]):
+        try:
+            beacon = decode_beacon(data, addr)
+        except XPlaneVersionNotSupported:
+            return
+        if beacon is not None:
+            self.registry.heard(beacon)
+
+
+class BeaconRegistry:
+    """Live X-Plane instances keyed by "ip:port", dropped when silent for `expire_after` seconds"""
+
+    def __init__(self, expire_after: float = 5.0):
+        # X-Plane beacons once a second
+        self.expire_after = expire_after
+        self._beacons: dict[str, SimBeacon] = {}
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self._transport: asyncio.DatagramTransport | None = None
+
+    async def start(self):
+        if self._transport is not None:
+            return
+        self._transport, _protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _RegistryProtocol(self), sock=open_beacon_socket())
+
+    def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def heard(self, beacon: XPlaneBeaconData):
+        key = sim_key(beacon)
+        if key not in self._beacons:
+            logger.info("X-Plane %s heard at %s", beacon.hostname, key)
+        self._beacons[key] = SimBeacon(beacon, time.monotonic())
+        for waiter in self._waiters.pop(key, []):
+            if not waiter.done():
+                waiter.set_result(beacon)
+
+    def beacons(self) -> list[SimBeacon]:
+        """Every instance heard within `expire_after`"""
+        now = time.monotonic()
+        for key, sim in list(self._beacons.items()):
+            if now - sim.last_seen > self.expire_after:
+                logger.info("X-Plane %s at %s went silent", sim.beacon.hostname, key)
+                del self._beacons[key]
+        return list(self._beacons.values())
+
+    def resolve(self, selector: str) -> str | None:
+        """
+        Key of the live instance `selector` names: its "ip:port", its hostname or
+        its ip. None when no instance or more than one matches.
+        """
+        beacons = self.beacons()
+        for sim in beacons:
+            if sim.key == selector:
+                return sim.key
+        matches = [sim.key for sim in beacons if selector in (sim.beacon.hostname, sim.beacon.ip)]
+        return matches[0] if len(matches) == 1 else None
+
+    async def wait_for(self, key: str, timeout: float = 3.0) -> XPlaneBeaconData:
+        """Beacon of the instance `key`, waiting up to `timeout` for it to be heard"""
+        if key in {sim.key for sim in self.beacons()}:
+            return self._beacons[key].beacon
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError as exc:
+            raise XPlaneIpNotFound(f"X-Plane {key} is not beaconing.") from exc
+        finally:
+            if waiter in self._waiters.get(key, []):
+                self._waiters[key].remove(waiter)
+
+
+class XPlanePool:
+    """One `XPlaneConnection` per X-Plane instance, created the first time an instance is selected"""
+
+    def __init__(self, freq: int = 5, retry_interval: float = 1.0, expire_after: float = 5.0):
+        self.freq = freq
+        self.retry_interval = retry_interval
+        self.registry = BeaconRegistry(expire_after)
+        self.connections: dict[str, XPlaneConnection] = {}
+
+    async def start(self):
+        await self.registry.start()
+
+    async def stop(self):
+        self.registry.stop()
+        for connection in self.connections.values():
+            await connection.stop()
+        self.connections.clear()
+
+    def resolve(self, selector: str) -> str | None:
+        """Key of the instance `selector` names, see `BeaconRegistry.resolve`"""
+        if selector in self.connections:
+            # keep serving a selected instance through a missed beacon or two
+            return selector
+        return self.registry.resolve(selector)
+
+    def connection(self, key: str) -> XPlaneConnection:
+        """Persistent connection to the instance `key`, following it through restarts"""
+        connection = self.connections.get(key)
+        if connection is None:
+            connection = XPlaneConnection(self.freq, self.retry_interval,
+                                          locate=lambda: self.registry.wait_for(key))
+            connection.start()
+            self.connections[key] = connection
+        return connection